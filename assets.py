@@ -0,0 +1,107 @@
+from io import BytesIO
+import hashlib
+import os
+import threading
+import time
+import constants
+import instrumentation
+import storage
+
+
+# Files in this directory are served by Streamlit at app/static/<name> (server.enableStaticServing).
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+STATIC_URL = 'app/static'
+
+# (bucket_name, file_key, size) -> {'etag', 'validated_at', 'url'}
+_logos = {}
+_logos_lock = threading.Lock()
+
+
+def _downscale(image_data, size):
+    """
+    Shrinks an image so that it just covers a size x size pixel box and recompresses it as an optimized PNG.
+
+    Images that are already small enough are only recompressed.
+    """
+    from PIL import Image
+
+    with Image.open(BytesIO(image_data)) as image:
+        scale = min(1.0, max(size / image.width, size / image.height))
+        if scale < 1.0:
+            # Pillow resamples palette and 1-bit images with NEAREST whatever filter is asked for.
+            if image.mode in ('1', 'P'):
+                image = image.convert('RGBA')
+            image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+        output = BytesIO()
+        image.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+def _publish(file_key, size, image_data):
+    """
+    Writes a processed logo under a content-hashed name into STATIC_DIR, removes older versions of it and
+    returns its URL. A content-hashed name never changes meaning, so browsers can keep it cached.
+    """
+    stem = os.path.splitext(os.path.basename(file_key))[0]
+    prefix = f"{stem}-{size}-"
+    file_name = f"{prefix}{hashlib.sha256(image_data).hexdigest()[:16]}.png"
+    path = os.path.join(STATIC_DIR, file_name)
+
+    if not os.path.exists(path):
+        os.makedirs(STATIC_DIR, exist_ok=True)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(image_data)
+        os.replace(path + '.tmp', path)
+        for old_name in os.listdir(STATIC_DIR):
+            if old_name.startswith(prefix) and old_name != file_name:
+                os.remove(os.path.join(STATIC_DIR, old_name))
+
+    return f"{STATIC_URL}/{file_name}"
+
+
+@instrumentation.instrumented
+def logo_url(bucket_name, file_key, aws_access_key_id, aws_secret_access_key, size,
+             ttl=constants.S3_CACHE_TTL_SECONDS):
+    """
+    Returns a URL for a logo downscaled to LOGO_PIXEL_RATIO times its displayed size, so it stays sharp on HiDPI
+    screens, served as a static file instead of inline base64.
+
+    The image is downloaded, downscaled and recompressed once per object version; afterwards it is revalidated
+    with a conditional GET at most every ttl seconds. The signature matches the download_data loaders, so it
+    can be used in fetch_many with functools.partial to fix size.
+
+    Parameters:
+    - bucket_name (str): The name of the S3 bucket.
+    - file_key (str): The key (path) to the image file in the bucket.
+    - aws_access_key_id (str): AWS Access Key ID with permission to access the bucket.
+    - aws_secret_access_key (str): AWS Secret Access Key corresponding to the Access Key ID.
+    - size (int): The displayed size in CSS pixels; the image is shrunk until it just covers
+      size x size CSS pixels at LOGO_PIXEL_RATIO.
+    - ttl (float): Seconds a published logo is used without asking S3.
+
+    Returns:
+    - str: The URL of the logo, relative to the app.
+    """
+    logo_key = (bucket_name, file_key, size)
+    now = time.monotonic()
+
+    with _logos_lock:
+        entry = _logos.get(logo_key)
+    if entry is not None and now - entry['validated_at'] < ttl:
+        return entry['url']
+
+    backend = storage.get_storage(aws_access_key_id, aws_secret_access_key)
+    response = backend.get_object(bucket_name, file_key, if_none_match=entry['etag'] if entry else None)
+    if response is None:
+        entry['validated_at'] = now
+        return entry['url']
+
+    with response['Body'] as body:
+        image_data = body.read()
+    instrumentation.annotate(key=file_key, bytes=len(image_data))
+    pixels = size * constants.LOGO_PIXEL_RATIO
+    url = _publish(file_key, pixels, _downscale(image_data, pixels))
+
+    with _logos_lock:
+        _logos[logo_key] = {'etag': response.get('ETag'), 'validated_at': now, 'url': url}
+    return url
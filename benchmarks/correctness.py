@@ -0,0 +1,138 @@
+"""
+Checks the vectorized aggregations against plain pandas versions of the same computation.
+
+Usage:
+    python -m benchmarks.correctness --cases 20
+
+aggregate_sites is compared with a groupby over Country that joins the site names with '<br>', on frames whose
+Country categories are not in sorted order. DrillDown.filtered_metrics is compared with _compute_metrics over
+boolean masks for random selections. Exits with status 1 if any result differs.
+"""
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+import metrics
+import schemas
+from benchmarks import synthetic
+
+
+def expected_sites(df, max_sites):
+    """
+    Reference for metrics.aggregate_sites: one groupby over Country with the sites joined in order of appearance.
+    """
+    df = df.dropna(subset=['Country']).astype({'Country': object, 'Site': object})
+    rows = []
+    for country, group in df.groupby('Country', sort=True):
+        names = list(dict.fromkeys(group['Site']))
+        label = '<br>'.join(str(name) for name in names[:max_sites])
+        if len(names) > max_sites:
+            label += f'<br>… and {len(names) - max_sites} more'
+        rows.append((country, label, group['Number of expected cases'].sum()))
+    return pd.DataFrame(rows, columns=['Country', 'Site', 'Number of expected cases'])
+
+
+def shuffled_categories(df, rng):
+    """
+    Returns df with every categorical column's categories in random order, as an export may list them.
+    """
+    df = df.copy()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            categories = list(df[column].cat.categories)
+            rng.shuffle(categories)
+            df[column] = df[column].cat.reorder_categories(categories)
+    return df
+
+
+def _differences(actual, expected):
+    """
+    Returns None if two frames are equal, apart from dtypes, else a short description of the first difference.
+    """
+    try:
+        pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True),
+                                      check_dtype=False, check_categorical=False)
+    except AssertionError as error:
+        return str(error).splitlines()[0]
+    return None
+
+
+def _sheets(case, rng):
+    main_df = synthetic.generate_main_sheet(n_sites=int(rng.integers(1, 60)), n_countries=int(rng.integers(1, 15)),
+                                            n_tracers=int(rng.integers(1, 4)), seed=case)
+    # Rows in random order with some sites moved to a second country, so sites appear in several groups.
+    main_df = main_df.sample(frac=1, random_state=case).reset_index(drop=True)
+    moved = rng.random(len(main_df)) < 0.1
+    main_df.loc[moved, 'Country'] = main_df['Country'].sample(frac=1, random_state=case + 1).to_numpy()[moved]
+    holdout_df = synthetic.generate_holdout_sheet(main_df, seed=case + 1)
+    main_df = shuffled_categories(schemas.enforce(main_df, schemas.MAIN_SCHEMA), rng)
+    holdout_df = shuffled_categories(schemas.enforce(holdout_df, schemas.HOLDOUT_SCHEMA), rng)
+    return main_df, holdout_df
+
+
+def check_aggregate_sites(main_df, rng):
+    max_sites = int(rng.integers(1, 6))
+    return _differences(metrics.aggregate_sites(main_df, max_sites=max_sites), expected_sites(main_df, max_sites))
+
+
+def _sample(values, rng):
+    values = list(values)
+    return rng.choice(values, size=int(rng.integers(0, min(len(values), 3) + 1)), replace=False).tolist()
+
+
+def check_filtered_metrics(main_df, holdout_df, rng, selections):
+    drill_down = metrics.DrillDown(main_df, holdout_df)
+    for _ in range(selections):
+        tracers = _sample(main_df['Tracer'].unique(), rng)
+        countries = _sample(main_df['Country'].unique(), rng)
+        sites = _sample(main_df['Site'].unique(), rng)
+
+        mask = np.ones(len(main_df), dtype=bool)
+        holdout_mask = np.ones(len(holdout_df), dtype=bool)
+        if tracers:
+            mask &= main_df['Tracer'].isin(tracers).to_numpy()
+            holdout_mask &= holdout_df['Tracer'].isin(tracers).to_numpy()
+        if countries:
+            mask &= main_df['Country'].isin(countries).to_numpy()
+            holdout_mask &= holdout_df['Site'].isin(main_df.loc[main_df['Country'].isin(countries), 'Site']).to_numpy()
+        if sites:
+            mask &= main_df['Site'].isin(sites).to_numpy()
+            holdout_mask &= holdout_df['Site'].isin(sites).to_numpy()
+
+        actual = drill_down.filtered_metrics(tracers, countries, sites)
+        expected = metrics._compute_metrics(main_df[mask], holdout_df[holdout_mask])
+        for field in ('tracers', 'sites', 'countries', 'holdout_tracers', 'holdout_sites'):
+            difference = _differences(getattr(actual, field).reset_index(), getattr(expected, field).reset_index())
+            if difference:
+                return f"{field} for tracers={tracers} countries={countries} sites={sites}: {difference}"
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', type=int, default=20, help="random sheets to check")
+    parser.add_argument('--selections', type=int, default=10, help="filter selections per sheet")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    failures = 0
+    for case in range(args.cases):
+        main_df, holdout_df = _sheets(args.seed + case, rng)
+        checks = {'aggregate_sites': lambda: check_aggregate_sites(main_df, rng),
+                  'filtered_metrics': lambda: check_filtered_metrics(main_df, holdout_df, rng, args.selections)}
+        for name, check in checks.items():
+            try:
+                problem = check()
+            except Exception as error:
+                problem = f"raised {error!r}"
+            if problem:
+                failures += 1
+                print(f"case {case:<4} {name:<17} {problem}")
+
+    print(f"{args.cases} sheets checked, {failures} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
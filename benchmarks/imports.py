@@ -0,0 +1,66 @@
+"""
+Checks that the Streamlit-free modules import without the UI stack and within an import-time budget.
+
+Usage:
+    python -m benchmarks.imports --budget-ms 1000
+
+Every module is imported in a fresh interpreter, so the timings are cold starts as a worker or batch job sees
+them. Exits with status 1 if a module pulls in one of FORBIDDEN_MODULES or takes longer than the budget.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+
+# The modules a headless job (export, workers, benchmarks) may use without Streamlit.
+CORE_MODULES = ["constants", "instrumentation", "storage", "schemas", "download_data", "metrics", "snapshots",
+                "figure_cache", "plots", "assets", "data_service", "export"]
+# Imported by the Streamlit app only; none of the core modules may load them.
+FORBIDDEN_MODULES = ["streamlit", "altair", "plotly.express", "boto3"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'ms': elapsed * 1000, 'loaded': [name for name in {forbidden!r} if name in sys.modules]}}))
+"""
+
+
+def measure(module, repeat):
+    """
+    Imports a module in repeat fresh interpreters.
+
+    Returns:
+    - dict: The fastest import time in milliseconds ('ms') and the forbidden modules it loaded ('loaded').
+    """
+    results = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', PROBE.format(module=module, forbidden=FORBIDDEN_MODULES)],
+                                check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {'ms': round(min(result['ms'] for result in results), 1), 'loaded': results[0]['loaded']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=1000, help="import time budget per module")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('modules', nargs='*', default=CORE_MODULES)
+    args = parser.parse_args(argv)
+
+    failures = 0
+    for module in args.modules:
+        result = measure(module, args.repeat)
+        problems = [f"loads {', '.join(result['loaded'])}"] if result['loaded'] else []
+        if result['ms'] > args.budget_ms:
+            problems.append(f"over the {args.budget_ms:.0f} ms budget")
+        failures += bool(problems)
+        print(f"{module:<16} {result['ms']:>8.1f} ms  {'; '.join(problems) or 'ok'}")
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Drives many concurrent headless dashboard sessions against an in-memory S3 stand-in and reports their cost.
+
+Usage:
+    python -m benchmarks.load --sessions 20 --reruns 10 --sites 500 --output load.json
+
+Every session runs dashboard.py through Streamlit's AppTest in its own thread, first loading the page and then
+applying random interactions (filters, toggles, plain reruns). All sessions share the server process, exactly as
+viewers of one Streamlit server do, so shared caches and the background data service are exercised as deployed.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import constants
+import figure_cache
+import storage
+from benchmarks import stub_s3, synthetic
+
+
+DASHBOARD = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dashboard.py')
+MAIN_KEY = constants.SNAPSHOT_PREFIX + "dashboard_excel_01012030.csv"
+
+
+def peak_rss_bytes():
+    """
+    Returns the peak resident set size of this process, or None where the resource module is not available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _toggle(at, rng):
+    toggles = list(at.toggle)
+    if toggles:
+        toggle = rng.choice(toggles)
+        toggle.set_value(not toggle.value)
+    return at.run()
+
+
+def _filter(key):
+    def action(at, rng):
+        widget = at.multiselect(key=key)
+        chosen = rng.sample(list(widget.options), k=min(len(widget.options), rng.choice([0, 1, 1, 2])))
+        widget.set_value(chosen)
+        return at.run()
+    return action
+
+
+# Interaction name -> action(at, rng) that changes the session and reruns it.
+ACTIONS = {
+    'rerun': lambda at, rng: at.run(),
+    'toggle': _toggle,
+    'filter_tracers': _filter('filter_tracers'),
+    'filter_countries': _filter('filter_countries'),
+    'filter_sites': _filter('filter_sites'),
+}
+
+
+def run_session(index, reruns, seed, timeout):
+    """
+    Loads the page in a fresh session and applies reruns - 1 random interactions.
+
+    Returns:
+    - dict: The latency of every rerun in milliseconds ('latencies_ms', the first one being the page load), the
+      actions applied and the exceptions the script raised.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed + index)
+    at = AppTest.from_file(DASHBOARD, default_timeout=timeout)
+    latencies, actions, exceptions = [], ['load'], []
+
+    start = time.perf_counter()
+    at.run()
+    latencies.append((time.perf_counter() - start) * 1000)
+    exceptions.extend(exception.value for exception in at.exception)
+
+    for _ in range(reruns - 1):
+        name = rng.choice(list(ACTIONS))
+        start = time.perf_counter()
+        at = ACTIONS[name](at, rng)
+        latencies.append((time.perf_counter() - start) * 1000)
+        actions.append(name)
+        exceptions.extend(exception.value for exception in at.exception)
+
+    return {'latencies_ms': latencies, 'actions': actions, 'exceptions': exceptions}
+
+
+def percentile(values, q):
+    """
+    Returns the q-th percentile (0-100) of values with linear interpolation.
+    """
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _latency_summary(latencies):
+    if not latencies:
+        return None
+    return {'count': len(latencies), 'mean_ms': statistics.fmean(latencies),
+            'p50_ms': percentile(latencies, 50), 'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99), 'max_ms': max(latencies)}
+
+
+def run(n_sessions, reruns, concurrency, n_sites, n_countries, n_tracers, n_rows, seed=0, timeout=120):
+    """
+    Serves synthetic sheets from a stub S3 client and runs n_sessions sessions, concurrency of them at a time.
+
+    Returns:
+    - dict: Parameters, throughput, rerun latency percentiles (overall, page loads and interactions), peak RSS,
+      S3 calls in total and per session, figure cache counters and any script exceptions.
+    """
+    main_df = synthetic.generate_main_sheet(n_sites, n_countries, n_tracers, n_rows, seed)
+    holdout_df = synthetic.generate_holdout_sheet(main_df, seed=seed + 1)
+    logo = synthetic.png_bytes(512)
+    bucket = constants.DATA_BUCKET
+    s3 = stub_s3.StubS3Client({(bucket, MAIN_KEY): synthetic.to_csv_bytes(main_df),
+                               (bucket, constants.HOLDOUT_SHEET_KEY): synthetic.to_csv_bytes(holdout_df),
+                               (bucket, constants.ENHANCE_LOGO_KEY): logo,
+                               (bucket, constants.LION_LOGO_KEY): logo})
+    storage.use_s3_client(s3)
+    constants.STORAGE_BACKEND = 's3'
+    # Streamlit's magic rewrites the script with ast.parse, which is not thread-safe in CPython 3.11 and fails
+    # when sessions start at once. dashboard.py does not rely on magic, so the harness turns it off.
+    from streamlit import config
+    config.set_option('runner.magicEnabled', False)
+    # Sessions should share the in-process caches only, not Parquet copies left by earlier runs.
+    constants.COLUMNAR_CACHE = False
+
+    rss_before = peak_rss_bytes()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='session') as executor:
+        sessions = list(executor.map(lambda index: run_session(index, reruns, seed, timeout), range(n_sessions)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for session in sessions for latency in session['latencies_ms']]
+    loads = [session['latencies_ms'][0] for session in sessions]
+    interactions = [latency for session in sessions for latency in session['latencies_ms'][1:]]
+    calls = dict(s3.calls)
+
+    return {
+        'params': {'sessions': n_sessions, 'reruns': reruns, 'concurrency': concurrency, 'sites': n_sites,
+                   'countries': n_countries, 'tracers': n_tracers, 'rows': len(main_df), 'seed': seed},
+        'elapsed_s': elapsed,
+        'throughput_reruns_per_s': len(latencies) / elapsed,
+        'latency': _latency_summary(latencies),
+        'page_load_latency': _latency_summary(loads),
+        'interaction_latency': _latency_summary(interactions),
+        'peak_rss_bytes': peak_rss_bytes(),
+        'peak_rss_before_bytes': rss_before,
+        's3_calls': calls,
+        's3_calls_per_session': sum(calls.values()) / n_sessions,
+        's3_bytes_per_session': s3.bytes_sent / n_sessions,
+        'figure_cache': figure_cache.stats(),
+        'exceptions': sorted({str(exception) for session in sessions for exception in session['exceptions']}),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--reruns', type=int, default=5, help="reruns per session, including the page load")
+    parser.add_argument('--concurrency', type=int, default=None, help="sessions run at once, default all")
+    parser.add_argument('--sites', type=int, default=50)
+    parser.add_argument('--countries', type=int, default=20)
+    parser.add_argument('--tracers', type=int, default=2)
+    parser.add_argument('--rows', type=int, default=None, help="rows of the main sheet, default one per site and tracer")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=120, help="seconds a single rerun may take")
+    parser.add_argument('--output', default='-', help="JSON output file, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    results = run(args.sessions, args.reruns, args.concurrency or args.sessions, args.sites, args.countries,
+                  args.tracers, args.rows, args.seed, args.timeout)
+
+    if args.output == '-':
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 1 if results['exceptions'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+Times the hot paths of the dashboard on synthetic sheets served by an in-memory S3 stand-in.
+
+Usage:
+    python -m benchmarks.run --sites 2000 --countries 40 --tracers 4 --rows 200000 --output bench.json
+
+Every stage is timed separately and the results are written as JSON, so runs can be compared over time.
+"""
+import argparse
+import inspect
+import json
+import platform
+import statistics
+import sys
+import time
+import pandas as pd
+import plotly
+import constants
+import download_data
+import metrics
+import plots
+import schemas
+import storage
+from benchmarks import stub_s3, synthetic
+
+
+BUCKET = "benchmark"
+MAIN_KEY = "lion/dashboard_excel_01012030.csv"
+HOLDOUT_KEY = "lion/dashboard_holdout.csv"
+
+
+def time_stage(function, repeat):
+    """
+    Calls function repeat times and returns its timings in milliseconds together with its last result.
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - start) * 1000)
+    summary = {'repeat': repeat, 'min_ms': min(timings), 'median_ms': statistics.median(timings),
+               'mean_ms': statistics.fmean(timings), 'max_ms': max(timings)}
+    return summary, result
+
+
+def cold_read(file_key, schema):
+    download_data.clear_sheet_cache()
+    return download_data.read_excel_from_s3(BUCKET, file_key, None, None, columns=list(schema), schema=schema)
+
+
+def run(n_sites, n_countries, n_tracers, n_rows, repeat, seed=0):
+    """
+    Runs every benchmark stage once per repeat on freshly generated sheets.
+
+    Returns:
+    - dict: Parameters, environment, per-stage timings and figure payload sizes.
+    """
+    main_df = synthetic.generate_main_sheet(n_sites, n_countries, n_tracers, n_rows, seed)
+    holdout_df = synthetic.generate_holdout_sheet(main_df, seed=seed + 1)
+    tracers = synthetic.tracer_names(n_tracers)
+
+    s3 = stub_s3.StubS3Client({(BUCKET, MAIN_KEY): synthetic.to_csv_bytes(main_df),
+                               (BUCKET, HOLDOUT_KEY): synthetic.to_csv_bytes(holdout_df)})
+    storage.use_s3_client(s3)
+    constants.STORAGE_BACKEND = 's3'
+    # Time the CSV path itself, not the local columnar copies.
+    constants.COLUMNAR_CACHE = False
+
+    stages = {}
+    stages['read_excel_from_s3'], df = time_stage(lambda: cold_read(MAIN_KEY, schemas.MAIN_SCHEMA), repeat)
+    stages['read_excel_from_s3 (holdout)'], holdout = time_stage(
+        lambda: cold_read(HOLDOUT_KEY, schemas.HOLDOUT_SCHEMA), repeat)
+    stages['aggregate_csv_from_s3'], _ = time_stage(lambda: (download_data.clear_sheet_cache(),
+                                                             download_data.aggregate_csv_from_s3(
+                                                                 BUCKET, MAIN_KEY, None, None,
+                                                                 ["Site", "Tracer", "Country"],
+                                                                 metrics.COUNT_COLUMNS,
+                                                                 schema=schemas.MAIN_SCHEMA)), repeat)
+    stages['groupbys'], summary = time_stage(lambda: metrics._compute_metrics(df, holdout), repeat)
+
+    # The uncached builders, so every repeat constructs the figure.
+    builders = {
+        'world_map_plot': lambda: inspect.unwrap(plots.world_map_plot)(summary.countries),
+        'horizontal_stacked_bar_chart': lambda: inspect.unwrap(plots.horizontal_stacked_bar_chart)(
+            summary.sites, top_n=constants.SITE_BAR_TOP_N),
+        'speedometer': lambda: [inspect.unwrap(plots.speedometer)(summary.curated(tracer), 5000)
+                                for tracer in tracers],
+        'holdout_bar_charts': lambda: list(inspect.unwrap(plots.holdout_bar_charts)(summary.holdout_sites).values()),
+    }
+    figures = []
+    for name, builder in builders.items():
+        stages[name], built = time_stage(builder, repeat)
+        figures.extend(built if isinstance(built, list) else [built])
+
+    stages['figure_json'], payloads = time_stage(lambda: [fig.to_json() for fig in figures], repeat)
+
+    return {
+        'params': {'sites': n_sites, 'countries': n_countries, 'tracers': n_tracers, 'rows': len(main_df),
+                   'holdout_rows': len(holdout_df), 'repeat': repeat, 'seed': seed},
+        'environment': {'python': platform.python_version(), 'pandas': pd.__version__,
+                        'plotly': plotly.__version__, 'machine': platform.machine()},
+        'stages': stages,
+        'payload_bytes': sum(len(payload) for payload in payloads),
+        'frame_bytes': {'main': int(df.memory_usage(deep=True).sum()),
+                        'holdout': int(holdout.memory_usage(deep=True).sum())},
+        's3_calls': dict(s3.calls),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sites', type=int, default=50)
+    parser.add_argument('--countries', type=int, default=20)
+    parser.add_argument('--tracers', type=int, default=2)
+    parser.add_argument('--rows', type=int, default=None, help="rows of the main sheet, default one per site and tracer")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='-', help="JSON output file, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    results = run(args.sites, args.countries, args.tracers, args.rows, args.repeat, args.seed)
+
+    if args.output == '-':
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
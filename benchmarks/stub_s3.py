@@ -0,0 +1,66 @@
+from collections import Counter
+from datetime import datetime, timezone
+from io import BytesIO
+import hashlib
+import threading
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+
+class StubS3Client:
+    """
+    In-memory stand-in for the parts of a boto3 S3 client the dashboard uses: get_object (with If-None-Match)
+    and the list_objects_v2 paginator. Counts calls per operation, so benchmarks can report S3 traffic.
+    """
+
+    def __init__(self, objects=None, page_size=1000):
+        # (bucket_name, file_key) -> (data, etag, last_modified)
+        self.objects = {}
+        self.page_size = page_size
+        self.calls = Counter()
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        for (bucket_name, file_key), data in (objects or {}).items():
+            self.put_object(bucket_name, file_key, data)
+
+    def put_object(self, bucket_name, file_key, data):
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        self.objects[(bucket_name, file_key)] = (data, etag, datetime.now(timezone.utc))
+
+    def _count(self, operation, size=0):
+        with self._lock:
+            self.calls[operation] += 1
+            self.bytes_sent += size
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if (Bucket, Key) not in self.objects:
+            self._count('GetObject')
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': 'The specified key does not exist.'},
+                               'ResponseMetadata': {'HTTPStatusCode': 404}}, 'GetObject')
+        data, etag, last_modified = self.objects[(Bucket, Key)]
+        if IfNoneMatch == etag:
+            self._count('GetObject')
+            raise ClientError({'Error': {'Code': '304', 'Message': 'Not Modified'},
+                               'ResponseMetadata': {'HTTPStatusCode': 304}}, 'GetObject')
+        self._count('GetObject', len(data))
+        return {'Body': StreamingBody(BytesIO(data), len(data)), 'ETag': etag, 'ContentLength': len(data),
+                'LastModified': last_modified}
+
+    def get_paginator(self, operation_name):
+        if operation_name != 'list_objects_v2':
+            raise NotImplementedError(operation_name)
+        return _ListObjectsPaginator(self)
+
+
+class _ListObjectsPaginator:
+
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, Bucket, Prefix=''):
+        items = [{'Key': file_key, 'ETag': etag, 'LastModified': last_modified, 'Size': len(data)}
+                 for (bucket_name, file_key), (data, etag, last_modified) in sorted(self.client.objects.items())
+                 if bucket_name == Bucket and file_key.startswith(Prefix)]
+        for start in range(0, max(len(items), 1), self.client.page_size):
+            self.client._count('ListObjectsV2')
+            yield {'Contents': items[start:start + self.client.page_size]}
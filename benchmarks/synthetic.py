@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+
+COUNTRY_CODES = ["AUT", "DEU", "USA", "CHN", "IND", "FRA", "ITA", "ESP", "GBR", "NLD", "BEL", "CHE", "SWE", "NOR",
+                 "DNK", "FIN", "POL", "CZE", "HUN", "PRT", "IRL", "CAN", "MEX", "BRA", "ARG", "CHL", "JPN", "KOR",
+                 "AUS", "NZL", "ZAF", "EGY", "TUR", "ISR", "SAU", "ARE", "SGP", "THA", "VNM", "IDN"]
+
+
+def tracer_names(n_tracers):
+    """
+    Returns n_tracers tracer names, starting with the real ones.
+    """
+    names = ["FDG", "PSMA"]
+    return (names + [f"TRACER{i}" for i in range(len(names), n_tracers)])[:n_tracers]
+
+
+def generate_main_sheet(n_sites=50, n_countries=20, n_tracers=2, n_rows=None, seed=0):
+    """
+    Generates a synthetic main sheet shaped like the LION export.
+
+    Parameters:
+    - n_sites (int): Number of distinct sites.
+    - n_countries (int): Number of distinct countries the sites are spread over (at most len(COUNTRY_CODES)).
+    - n_tracers (int): Number of distinct tracers.
+    - n_rows (int): Number of rows. Defaults to one row per (site, tracer); more rows repeat site/tracer pairs.
+    - seed (int): Random seed.
+
+    Returns:
+    - DataFrame: Columns Site, Country, Tracer and the expected, verified and curated case counts.
+    """
+    rng = np.random.default_rng(seed)
+    countries = np.array(COUNTRY_CODES[:n_countries])
+    tracers = np.array(tracer_names(n_tracers))
+    sites = np.array([f"Site {i:05d}" for i in range(n_sites)])
+    site_country = countries[rng.integers(0, len(countries), n_sites)]
+
+    if n_rows is None:
+        site_index = np.repeat(np.arange(n_sites), n_tracers)
+        tracer_index = np.tile(np.arange(n_tracers), n_sites)
+    else:
+        site_index = rng.integers(0, n_sites, n_rows)
+        tracer_index = rng.integers(0, n_tracers, n_rows)
+
+    expected = rng.integers(10, 1000, len(site_index))
+    verified = (expected * rng.random(len(site_index))).astype(int)
+    curated = (verified * rng.random(len(site_index))).astype(int)
+
+    return pd.DataFrame({
+        "Site": sites[site_index],
+        "Country": site_country[site_index],
+        "Tracer": tracers[tracer_index],
+        "Number of expected cases": expected,
+        "Number of verified cases": verified,
+        "Number of curated cases": curated,
+    })
+
+
+def generate_holdout_sheet(main_df, fraction=0.3, seed=1):
+    """
+    Generates a synthetic holdout sheet from a sample of the (Site, Tracer) pairs of a main sheet.
+
+    Parameters:
+    - main_df (DataFrame): A sheet from generate_main_sheet.
+    - fraction (float): Share of the (Site, Tracer) pairs that contribute holdout cases.
+    - seed (int): Random seed.
+
+    Returns:
+    - DataFrame: Columns Site, Tracer and the expected and verified case counts.
+    """
+    rng = np.random.default_rng(seed)
+    pairs = main_df[["Site", "Tracer"]].drop_duplicates()
+    pairs = pairs.sample(frac=fraction, random_state=seed) if len(pairs) > 1 else pairs
+    expected = rng.integers(5, 200, len(pairs))
+    verified = (expected * rng.random(len(pairs))).astype(int)
+    return pairs.assign(**{"Number of expected cases": expected,
+                           "Number of verified cases": verified}).reset_index(drop=True)
+
+
+def to_csv_bytes(df):
+    return df.to_csv(index=False).encode()
+
+
+def png_bytes(size=512):
+    """
+    Returns a size x size PNG, standing in for the logos.
+    """
+    from io import BytesIO
+    from PIL import Image
+
+    output = BytesIO()
+    Image.new('RGBA', (size, size), (140, 82, 255, 255)).save(output, format='PNG')
+    return output.getvalue()
@@ -1,2 +1,70 @@
+import os
+
 NUMBER_OF_FDG_CASES = 5341
-NUMBER_OF_PSMA_CASES = 2500
\ No newline at end of file
+NUMBER_OF_PSMA_CASES = 2500
+# Number of cases each tracer's model aims for. Tracers not listed here are measured against their expected cases.
+TARGET_CASES = {"FDG": NUMBER_OF_FDG_CASES, "PSMA": NUMBER_OF_PSMA_CASES}
+
+# Seconds a downloaded sheet is served from memory before it is revalidated against S3.
+S3_CACHE_TTL_SECONDS = int(os.getenv('LION_S3_CACHE_TTL_SECONDS', 300))
+# Upper bound on the in-memory size of all cached sheets, evicted least recently used first.
+S3_CACHE_MAX_BYTES = int(os.getenv('LION_S3_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Connection pool of the process-wide S3 client shared by every loader and every Streamlit session.
+S3_MAX_POOL_CONNECTIONS = int(os.getenv('LION_S3_MAX_POOL_CONNECTIONS', 32))
+S3_CONNECT_TIMEOUT_SECONDS = float(os.getenv('LION_S3_CONNECT_TIMEOUT_SECONDS', 5))
+S3_READ_TIMEOUT_SECONDS = float(os.getenv('LION_S3_READ_TIMEOUT_SECONDS', 30))
+S3_MAX_ATTEMPTS = int(os.getenv('LION_S3_MAX_ATTEMPTS', 3))
+
+# Where download_data reads objects from: 's3', 'local' (a directory laid out as <bucket>/<key>) or
+# 'cached' (S3 behind a read-through disk cache).
+STORAGE_BACKEND = os.getenv('LION_STORAGE_BACKEND', 's3')
+LOCAL_STORAGE_DIR = os.getenv('LION_LOCAL_DIR', 'data')
+DISK_CACHE_DIR = os.getenv('LION_DISK_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'lion-dashboard'))
+DISK_CACHE_TTL_SECONDS = int(os.getenv('LION_DISK_CACHE_TTL_SECONDS', 300))
+
+DATA_BUCKET = "enhance-pet"
+ENHANCE_LOGO_KEY = "lion/enhance-logo.png"
+LION_LOGO_KEY = "lion/lion_round.png"
+# Device pixels per CSS pixel that logos are kept at, so they stay sharp on HiDPI screens.
+LOGO_PIXEL_RATIO = int(os.getenv('LION_LOGO_PIXEL_RATIO', 2))
+MAIN_SHEET_KEY = "lion/dashboard_excel_10072025.csv"
+HOLDOUT_SHEET_KEY = "lion/dashboard_holdout.csv"
+
+# Sites beyond this many are combined into one 'Other' segment of the expected cases bar.
+SITE_BAR_TOP_N = int(os.getenv('LION_SITE_BAR_TOP_N', 50))
+
+# Upper bound on the serialized size of all figures kept by figure_cache, evicted least recently used first.
+FIGURE_CACHE_MAX_BYTES = int(os.getenv('LION_FIGURE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# Main sheet exports are discovered under SNAPSHOT_PREFIX as dashboard_excel_<DDMMYYYY>.csv; MAIN_SHEET_KEY is
+# only used if no export is found.
+SNAPSHOT_PREFIX = "lion/"
+SNAPSHOT_LISTING_TTL_SECONDS = int(os.getenv('LION_SNAPSHOT_LISTING_TTL_SECONDS', 300))
+# Number of ingested snapshots whose per-tracer totals are kept in the snapshot history.
+SNAPSHOT_HISTORY_LENGTH = int(os.getenv('LION_SNAPSHOT_HISTORY_LENGTH', 52))
+
+# CSV sheets are converted once per object version to Parquet copies in this directory (needs pyarrow).
+COLUMNAR_CACHE = os.getenv('LION_COLUMNAR_CACHE', '1') == '1'
+COLUMNAR_CACHE_DIR = os.getenv('LION_COLUMNAR_CACHE_DIR', os.path.join(DISK_CACHE_DIR, 'columnar'))
+
+# Rows parsed per chunk by download_data.aggregate_csv_from_s3.
+CSV_CHUNK_ROWS = int(os.getenv('LION_CSV_CHUNK_ROWS', 100_000))
+
+# Log a JSON line per timed stage (download, parse, aggregation, figure building) and show the performance
+# panel to every viewer. The panel can also be opened for a single session with the ?perf=1 query parameter.
+PERF_LOGGING = os.getenv('LION_PERF', '0') == '1'
+
+# Sites named in the hover label of a country on the world map; further sites are counted, not named.
+MAP_MAX_SITES_PER_COUNTRY = int(os.getenv('LION_MAP_MAX_SITES_PER_COUNTRY', 10))
+
+# Seconds between two background refreshes of the data shared by all sessions of a server process.
+DATA_REFRESH_SECONDS = int(os.getenv('LION_DATA_REFRESH_SECONDS', 60))
+# Seconds before the first retry of a failed data load; the delay doubles per failure up to DATA_REFRESH_SECONDS.
+DATA_RETRY_SECONDS = int(os.getenv('LION_DATA_RETRY_SECONDS', 2))
+
+# Default directory of the static bundle written by export.py.
+EXPORT_DIR = os.getenv('LION_EXPORT_DIR', 'export')
+
+# Filter combinations of the drill-down whose aggregates are kept, least recently used evicted first.
+DRILL_DOWN_CACHE_SIZE = int(os.getenv('LION_DRILL_DOWN_CACHE_SIZE', 128))
@@ -1,11 +1,151 @@
 import streamlit as st
-import altair as alt
+import pandas as pd
 import os
 import constants
-import download_data
+import data_service
+import figure_cache
+import instrumentation
+import metrics
 import plots
 
 
+def display_progress_bar(actual_value, expected_total, title="Segmented cases", unique_id=""):
+    """
+    Displays a progress bar indicating the progress towards the expected total with a custom pink color and bold text.
+    Parameters:
+    - actual_value (float): The current value achieved.
+    - expected_total (float): The total value expected.
+    - title (str): The title displayed above the progress bar.
+    - unique_id (str): A unique identifier to avoid CSS class name collisions.
+    """
+    progress_percentage = actual_value / expected_total
+    bar_width = progress_percentage * 100  # percent for CSS width
+
+    st.markdown(f"**{title}**")
+
+    container_class = f"progress-container-{unique_id}"
+    bar_class = f"progress-bar-{unique_id}"
+
+    progress_html = f"""
+    <style>
+    .{container_class} {{
+        width: 100%;
+        background-color: #ddd;
+        border-radius: 5px;
+    }}
+    .{bar_class} {{
+        width: {bar_width:.1f}%;
+        height: 30px;
+        background-color: #ff69b4;
+        text-align: center;
+        line-height: 30px;
+        color: white;
+        font-weight: bold;
+        border-radius: 5px;
+    }}
+    </style>
+    <div class="{container_class}">
+      <div class="{bar_class}">{progress_percentage:.1%}</div>
+    </div>
+    """
+
+    st.markdown(progress_html, unsafe_allow_html=True)
+    st.markdown(f"**{progress_percentage:.1%}** ({actual_value} of {expected_total})")
+
+
+
+def display_performance_panel(records):
+    """
+    Displays the timed stages of the current render and the figure cache counters in a collapsed expander.
+
+    Parameters:
+    - records (list of dict): Spans collected by instrumentation.start_recording.
+    """
+    with st.expander("Performance", expanded=False):
+        if records:
+            spans = pd.DataFrame(records)
+            first = ["name", "wall_ms"]
+            spans = spans[first + [column for column in spans.columns if column not in first]]
+            st.markdown(f"**{len(spans)} spans**, slowest first")
+            st.dataframe(spans.sort_values("wall_ms", ascending=False), use_container_width=True)
+        st.markdown("**Figure cache**")
+        st.json(figure_cache.stats())
+
+
+def filter_sidebar(drill_down):
+    """
+    Renders the tracer, country and site filters in the sidebar. Country options only list countries of the
+    selected tracers, site options only sites of the selected tracers and countries.
+
+    Parameters:
+    - drill_down (DrillDown): The indexed sheets of the current snapshot.
+
+    Returns:
+    - dict: The selected 'tracers', 'countries' and 'sites'; an empty list selects everything.
+    """
+    with st.sidebar:
+        st.header("Filters")
+        tracers = st.multiselect("Tracer", drill_down.tracers, key="filter_tracers")
+        countries = st.multiselect("Country", drill_down.options("Country", tracers=tracers),
+                                   key="filter_countries")
+        sites = st.multiselect("Site", drill_down.options("Site", tracers=tracers, countries=countries),
+                               key="filter_sites")
+    return {'tracers': tracers, 'countries': countries, 'sites': sites}
+
+
+@st.fragment
+def overview_section(summary):
+    """
+    Renders the expected cases per site and, when shown, the world map. Toggling the map only reruns this section.
+    """
+    st.plotly_chart(plots.horizontal_stacked_bar_chart(summary.sites, top_n=constants.SITE_BAR_TOP_N),
+                    use_container_width=True)
+
+    if st.toggle("Show world map", value=True, key="show_world_map"):
+        st.plotly_chart(plots.world_map_plot(summary.countries), use_container_width=True)
+
+
+@st.fragment
+def model_section(summary, tracer, total_cases):
+    """
+    Renders the gauge, progress and holdout numbers of one tracer's model. The holdout chart is only built when
+    shown, and toggling it only reruns this section.
+    """
+    # Centered secondary title with adjusted spacing
+    st.markdown(
+        f"""
+        <h2 style='text-align: center; margin-top: 50px; margin-bottom: 20px;'>
+            {tracer} model
+        </h2>
+        """,
+        unsafe_allow_html=True
+    )
+
+    if total_cases:
+        st.plotly_chart(plots.speedometer(summary.curated(tracer), total_cases))
+        display_progress_bar(summary.verified(tracer), total_cases, unique_id=metrics.slug(tracer))
+    else:
+        # Without expected cases there is no progress to measure.
+        st.markdown(f"**No target set** ({summary.verified(tracer)} segmented cases)")
+
+    st.markdown(
+        f"""
+        <div style='text-align: center; margin-top: 30px; margin-bottom: 10px;'>
+            <span style="font-size: 18px;">
+                Number of cases for <span style="color:#ff69b4;"><strong>{tracer} holdout</strong></span>
+            </span>
+            <div style="font-size: 48px; font-weight: bold; color: white; margin-top: 10px;">
+                {summary.holdout_verified(tracer)}
+            </div>
+        </div>
+        """,
+        unsafe_allow_html=True
+    )
+
+    if st.toggle(f"Show {tracer} holdout sites", key=f"show_holdout_{metrics.slug(tracer)}"):
+        st.plotly_chart(plots.stacked_bar_holdout_per_tracer(summary.holdout_sites, tracer), use_container_width=True)
+
+
 def main():
     st.set_page_config(
         page_title="LION data overview",
@@ -14,14 +154,23 @@ def main():
 
 
 
+    perf_records = instrumentation.start_recording(
+        constants.PERF_LOGGING or st.query_params.get("perf") == "1")
+
     aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
     aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
 
-    enhance_logo = download_data.fetch_image_from_s3("enhance-pet", "lion/enhance-logo.png",
-                                                     aws_access_key_id, aws_secret_access_key)
+    service = data_service.get_data_service(aws_access_key_id, aws_secret_access_key)
+    data = service.snapshot()
 
-    lion_logo = download_data.fetch_image_from_s3("enhance-pet", "lion/lion_round.png",
-                                                   aws_access_key_id, aws_secret_access_key)
+    if data is None:
+        for file_key, error in service.last_errors.items():
+            st.error(f"Could not load {file_key}: {error}")
+        st.info("The data is not available yet and is being retried in the background. Reload the page shortly.")
+        st.stop()
+
+    enhance_logo = data.enhance_logo
+    lion_logo = data.lion_logo
 
     #Display the image using HTML and CSS for styling
     st.markdown(
@@ -47,7 +196,7 @@ def main():
         </style>
 
         <a href="https://www.enhance.pet" target="_blank" rel="noopener noreferrer" class="clickable-image">
-            <img src='data:image/jpeg;base64,{enhance_logo}'>
+            <img src='{enhance_logo}'>
         </a>
         """,
         unsafe_allow_html=True
@@ -77,7 +226,7 @@ def main():
         <div class="header-container">
             <div class="logo-container">
                 <a href="https://github.com/LalithShiyam/LION" target="_blank">
-                    <img class="logo-img" src="data:image/jpeg;base64,{lion_logo}" alt="Logo">
+                    <img class="logo-img" src="{lion_logo}" alt="Logo">
                 </a>
             </div>
             <h1>LION Data Dashboard</h1>
@@ -86,105 +235,40 @@ def main():
 
     st.markdown(header_html, unsafe_allow_html=True)
 
-    df = download_data.read_excel_from_s3(bucket_name="enhance-pet", file_key="lion/dashboard_excel_10072025.csv",
-                                          aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key)
-
-    holdout_df = download_data.read_excel_from_s3(bucket_name="enhance-pet", file_key="lion/dashboard_holdout.csv",
-                                          aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key)
-
-    fdg_holdout_bar = plots.stacked_bar_holdout_per_tracer(holdout_df, "FDG")
-    psma_holdout_bar = plots.stacked_bar_holdout_per_tracer(holdout_df, "PSMA")
-
-    # Group by tracer and sum verified cases
-    holdout_summary = holdout_df.groupby("Tracer")["Number of verified cases"].sum().reset_index()
-    holdout_dict = dict(zip(holdout_summary["Tracer"], holdout_summary["Number of verified cases"]))
+    selection = filter_sidebar(data.drill_down)
+    summary = data.drill_down.filtered_metrics(**selection)
+    tracers = selection['tracers'] or data.drill_down.tracers
+    st.caption(f"Data from {data.main_sheet_key}, refreshed {data.age:.0f} s ago")
 
-    fdg_subset = df[df.Tracer== 'FDG']
-    psma_subset = df[df.Tracer == 'PSMA']
-
-    stacked_bar = plots.horizontal_stacked_bar_chart(df)
-    world_map = plots.world_map_plot(df)
-    fdg_plot = plots.speedometer(fdg_subset, constants.NUMBER_OF_FDG_CASES)
-    psma_plot = plots.speedometer(psma_subset, constants.NUMBER_OF_PSMA_CASES)
-
-    fdg_verified = fdg_subset["Number of verified cases"].sum()
-    psma_verified = psma_subset["Number of verified cases"].sum()
-
-    st.plotly_chart(stacked_bar, use_container_width=True)
-    st.plotly_chart(world_map, use_container_width=True)
+    # Reserve the overview slot above the model columns, but fill it last: the headline numbers and gauges
+    # are cheap and reach the browser first, the site bar and world map follow.
+    overview_slot = st.container()
 
+    st.markdown(
+        """
+        <style>
+            .speedometer-container {
+                margin-top: -800px; /* Adjust this value as needed */
+            }
+        </style>
+        """,
+        unsafe_allow_html=True
+    )
 
     col1, col2, col3 = st.columns([1, 4, 1])
     with col2:
-        fdg_col, inner_col2, psma_col = st.columns([1, 1, 1])
-        with fdg_col:
-            # Centered secondary title with adjusted spacing
-            st.markdown(
-                """
-                <h2 style='text-align: center; margin-top: 50px; margin-bottom: 20px;'>
-                    FDG model
-                </h2>
-                """,
-                unsafe_allow_html=True
-            )
-            st.markdown(
-                """
-                <style>
-                    .speedometer-container {
-                        margin-top: -800px; /* Adjust this value as needed */
-                    }
-                </style>
-                """,
-                unsafe_allow_html=True
-            )
-            st.plotly_chart(fdg_plot)
-            plots.display_progress_bar(fdg_verified, constants.NUMBER_OF_FDG_CASES, unique_id="fdg")
-
-            fdg_holdout = holdout_dict.get("FDG", 0)
-            st.markdown(
-                f"""
-                <div style='text-align: center; margin-top: 30px; margin-bottom: 10px;'>
-                    <span style="font-size: 18px;">
-                        Number of cases for <span style="color:#ff69b4;"><strong>FDG holdout</strong></span>
-                    </span>
-                    <div style="font-size: 48px; font-weight: bold; color: white; margin-top: 10px;">
-                        {fdg_holdout}
-                    </div>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-            st.plotly_chart(fdg_holdout_bar, use_container_width=True)
-
-        with psma_col:
-            # Centered secondary title with adjusted spacing
-            st.markdown(
-                """
-                <h2 style='text-align: center; margin-top: 50px; margin-bottom: 20px;'>
-                    PSMA model
-                </h2>
-                """,
-                unsafe_allow_html=True
-            )
-
-            st.plotly_chart(psma_plot)
-            plots.display_progress_bar(psma_verified, constants.NUMBER_OF_PSMA_CASES, unique_id="psma")
-
-            psma_holdout = holdout_dict.get("PSMA", 0)
-            st.markdown(
-                f"""
-                <div style='text-align: center; margin-top: 30px; margin-bottom: 10px;'>
-                    <span style="font-size: 18px;">
-                        Number of cases for <span style="color:#ff69b4;"><strong>PSMA holdout</strong></span>
-                    </span>
-                    <div style="font-size: 48px; font-weight: bold; color: white; margin-top: 10px;">
-                        {psma_holdout}
-                    </div>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-            st.plotly_chart(psma_holdout_bar, use_container_width=True)
+        # One column per tracer with a spacer column between neighbours
+        model_cols = st.columns(max(2 * len(tracers) - 1, 1))[::2]
+        for model_col, tracer in zip(model_cols, tracers):
+            with model_col:
+                model_section(summary, tracer,
+                              constants.TARGET_CASES.get(tracer, data.summary.expected(tracer)))
+
+    with overview_slot:
+        overview_section(summary)
+
+    if perf_records is not None:
+        display_performance_panel(perf_records)
 
     # st.markdown(
     #     f"""
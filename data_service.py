@@ -0,0 +1,198 @@
+from dataclasses import dataclass
+from functools import partial
+import logging
+import threading
+import time
+import assets
+import constants
+import download_data
+import instrumentation
+import metrics
+import schemas
+import snapshots
+
+
+logger = logging.getLogger(__name__)
+
+# (aws_access_key_id, aws_secret_access_key) -> DataService, created on first use.
+_services = {}
+_services_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class DataSnapshot:
+    """
+    Everything the dashboard shows, loaded and parsed once and shared read-only by every session.
+
+    Attributes:
+    - main_sheet_key (str): The key of the main sheet export the data comes from.
+    - df (DataFrame): The main sheet.
+    - holdout_df (DataFrame): The holdout sheet.
+    - summary (DashboardMetrics): The aggregates of both sheets.
+    - drill_down (DrillDown): The indexed sheets, for aggregates filtered by tracer, country and site.
+    - enhance_logo (str): URL of the enhance logo.
+    - lion_logo (str): URL of the LION logo.
+    - loaded_at (float): time.time() when the snapshot was published.
+    """
+    main_sheet_key: str
+    df: object
+    holdout_df: object
+    summary: metrics.DashboardMetrics
+    drill_down: metrics.DrillDown
+    enhance_logo: str
+    lion_logo: str
+    loaded_at: float
+
+    @property
+    def age(self):
+        """
+        Seconds since the snapshot was published.
+        """
+        return time.time() - self.loaded_at
+
+
+class DataService:
+    """
+    Keeps one parsed copy of the dashboard data per server process and refreshes it in a background thread.
+
+    Sessions read the current snapshot without blocking; only the reads that arrive during the initial load wait
+    for it, and it runs once for all of them. A load that fails keeps the last good snapshot in place and is retried
+    by the background thread, after DATA_RETRY_SECONDS at first and doubling up to the refresh interval.
+    """
+
+    def __init__(self, aws_access_key_id, aws_secret_access_key, interval=constants.DATA_REFRESH_SECONDS):
+        self.aws_access_key_id = aws_access_key_id
+        self.aws_secret_access_key = aws_secret_access_key
+        self.interval = interval
+        # 'bucket/key' (or 'data') -> the exception that object raised in the last refresh.
+        self.last_errors = {}
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()
+        self._initial_load_lock = threading.Lock()
+        self._initial_load_done = False
+        self._failures = 0
+        self._next_attempt_at = time.monotonic() + interval
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @instrumentation.instrumented
+    def refresh(self):
+        """
+        Loads the data once and publishes it as the new snapshot if every object could be loaded.
+
+        Returns:
+        - bool: Whether a new snapshot was published.
+        """
+        with self._refresh_lock:
+            main_sheet_key = snapshots.find_latest_snapshot(constants.DATA_BUCKET, constants.SNAPSHOT_PREFIX,
+                                                            self.aws_access_key_id, self.aws_secret_access_key)
+
+            # The service polls on its own schedule, so every poll revalidates the objects (ttl=0).
+            fetched, errors = download_data.fetch_many([
+                (constants.DATA_BUCKET, constants.ENHANCE_LOGO_KEY, partial(assets.logo_url, size=175, ttl=0)),
+                (constants.DATA_BUCKET, constants.LION_LOGO_KEY, partial(assets.logo_url, size=400, ttl=0)),
+                (constants.DATA_BUCKET, main_sheet_key,
+                 partial(snapshots.read_snapshot, columns=metrics.MAIN_COLUMNS, ttl=0, schema=schemas.MAIN_SCHEMA)),
+                (constants.DATA_BUCKET, constants.HOLDOUT_SHEET_KEY,
+                 partial(download_data.read_excel_from_s3, columns=metrics.HOLDOUT_COLUMNS, ttl=0,
+                         schema=schemas.HOLDOUT_SCHEMA)),
+            ], self.aws_access_key_id, self.aws_secret_access_key)
+
+            self.last_errors = {f"{bucket_name}/{file_key}": error for (bucket_name, file_key), error in errors.items()}
+            if errors:
+                for name, error in self.last_errors.items():
+                    logger.warning("Could not load %s, keeping the last snapshot: %s", name, error)
+                return False
+
+            bucket = constants.DATA_BUCKET
+            df = fetched[(bucket, main_sheet_key)]
+            holdout_df = fetched[(bucket, constants.HOLDOUT_SHEET_KEY)]
+            drill_down = metrics.drill_down(df, holdout_df)
+            # Publishing is a single attribute assignment, so readers see either the old or the new snapshot.
+            self._snapshot = DataSnapshot(main_sheet_key=main_sheet_key,
+                                          df=df,
+                                          holdout_df=holdout_df,
+                                          summary=drill_down.filtered_metrics(),
+                                          drill_down=drill_down,
+                                          enhance_logo=fetched[(bucket, constants.ENHANCE_LOGO_KEY)],
+                                          lion_logo=fetched[(bucket, constants.LION_LOGO_KEY)],
+                                          loaded_at=time.time())
+            return True
+
+    def snapshot(self):
+        """
+        Returns the current snapshot, loading it first if this is the first read.
+
+        Returns:
+        - DataSnapshot or None: None while nothing could be loaded yet; the background thread keeps retrying and
+          last_errors holds the reasons of the last failure.
+        """
+        if self._snapshot is None and not self._initial_load_done:
+            with self._initial_load_lock:
+                # Sessions that waited for the lock find the load done and do not repeat it.
+                if self._snapshot is None and not self._initial_load_done:
+                    self._attempt()
+                    self._initial_load_done = True
+        return self._snapshot
+
+    def _attempt(self):
+        """
+        Refreshes once and schedules the next background attempt: after the interval on success, with exponential
+        backoff on failure.
+        """
+        try:
+            loaded = self.refresh()
+        except Exception as error:
+            logger.exception("Data load failed, keeping the last snapshot")
+            self.last_errors = {'data': error}
+            loaded = False
+        self._failures = 0 if loaded else self._failures + 1
+        delay = self.interval if loaded else min(self.interval,
+                                                 constants.DATA_RETRY_SECONDS * 2 ** (self._failures - 1))
+        self._next_attempt_at = time.monotonic() + delay
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            delay = self._next_attempt_at - time.monotonic()
+            if delay > 0:
+                # Woken early when another thread reschedules, e.g. after a failed initial load.
+                self._wake.wait(delay)
+                self._wake.clear()
+                continue
+            self._attempt()
+
+    def start(self):
+        """
+        Starts the background refresh thread if it is not running yet.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="lion-data-service", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+
+def get_data_service(aws_access_key_id, aws_secret_access_key):
+    """
+    Returns the process-wide data service for a set of credentials, creating and starting it on first use.
+
+    Parameters:
+    - aws_access_key_id (str): AWS Access Key ID with permission to access the bucket.
+    - aws_secret_access_key (str): AWS Secret Access Key corresponding to the Access Key ID.
+
+    Returns:
+    - DataService: The running service.
+    """
+    credentials = (aws_access_key_id, aws_secret_access_key)
+    with _services_lock:
+        service = _services.get(credentials)
+        if service is None:
+            service = DataService(aws_access_key_id, aws_secret_access_key)
+            _services[credentials] = service
+        service.start()
+    return service
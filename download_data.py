@@ -1,26 +1,274 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 from io import BytesIO
-import boto3
+import hashlib
+import importlib.util
+import logging
+import os
+import threading
+import time
 import pandas as pd
 import base64
+import constants
+import instrumentation
+import schemas
+import storage
 
 
-def read_excel_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_access_key):
-    s3 = boto3.client('s3',
-                      aws_access_key_id=aws_access_key_id,
-                      aws_secret_access_key=aws_secret_access_key)
+logger = logging.getLogger(__name__)
 
-    response = s3.get_object(Bucket=bucket_name, Key=file_key)
-    file_content = response['Body'].read()
+# Parquet support in pandas comes from the optional pyarrow package.
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
 
-    with BytesIO(file_content) as file:
-        df = pd.read_csv(file)
+# (bucket_name, file_key, columns) -> {'etag', 'validated_at', 'size', 'df'}, least recently used first.
+_sheet_cache = OrderedDict()
+_sheet_cache_lock = threading.Lock()
+
+
+def _store_sheet(cache_key, entry, max_bytes):
+    """
+    Inserts a parsed sheet into the cache and evicts least recently used sheets until it fits into max_bytes.
+    """
+    with _sheet_cache_lock:
+        _sheet_cache[cache_key] = entry
+        _sheet_cache.move_to_end(cache_key)
+        total = sum(cached['size'] for cached in _sheet_cache.values())
+        while total > max_bytes and len(_sheet_cache) > 1:
+            _, evicted = _sheet_cache.popitem(last=False)
+            total -= evicted['size']
+
+
+def clear_sheet_cache():
+    """
+    Drops every cached sheet, forcing the next read_excel_from_s3 call to download again.
+    """
+    with _sheet_cache_lock:
+        _sheet_cache.clear()
+
+
+def _parse_sheet(file, file_key, columns, schema=None):
+    """
+    Parses a sheet in the format given by the extension of its key, reading only the given columns, and
+    enforces the schema if one is given.
+    """
+    if file_key.endswith(('.parquet', '.feather')):
+        # Columnar readers need random access, so the object is buffered in memory first.
+        with BytesIO(file.read()) as buffer:
+            if file_key.endswith('.parquet'):
+                df = pd.read_parquet(buffer, columns=columns)
+            else:
+                df = pd.read_feather(buffer, columns=columns)
+    elif schema is None:
+        # CSV is parsed straight from the stream, without a second copy of the raw bytes.
+        df = pd.read_csv(file, usecols=columns)
+    else:
+        # Missing columns are reported by schemas.enforce rather than as a usecols mismatch.
+        wanted = set(columns) if columns is not None else None
+        df = pd.read_csv(file, usecols=(lambda column: column in wanted) if wanted is not None else None,
+                         dtype=schemas.csv_dtypes(schema))
+    return df if schema is None else schemas.enforce(df, schema)
+
+
+def _columnar_copy_path(bucket_name, file_key, columns, schema=None):
+    """
+    Returns where the local Parquet copy of a CSV sheet (restricted to the given columns and schema) is kept.
+    """
+    projection = repr(columns) if schema is None else repr((columns, schema))
+    projection = hashlib.sha1(projection.encode()).hexdigest()[:12] if columns or schema else 'all'
+    return os.path.join(constants.COLUMNAR_CACHE_DIR, bucket_name, *file_key.split('/')) + f'.{projection}.parquet'
+
+
+def _read_columnar_copy(path):
+    """
+    Returns the ETag of the CSV version a local Parquet copy was made from, or None if there is no copy.
+    """
+    if not (constants.COLUMNAR_CACHE and HAS_PYARROW and os.path.exists(path) and os.path.exists(path + '.etag')):
+        return None
+    with open(path + '.etag') as file:
+        return file.read().strip() or None
+
+
+def _write_columnar_copy(path, df, etag):
+    """
+    Stores a parsed CSV sheet as Parquet, so the next cold start of this object version skips the CSV download.
+    """
+    if not (constants.COLUMNAR_CACHE and HAS_PYARROW and etag):
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+        with open(path + '.etag', 'w') as file:
+            file.write(etag)
+    except (OSError, ValueError):
+        logger.warning("Could not write columnar copy %s", path, exc_info=True)
+
+
+@instrumentation.instrumented
+def read_excel_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_access_key, columns=None,
+                       ttl=constants.S3_CACHE_TTL_SECONDS, max_bytes=constants.S3_CACHE_MAX_BYTES, schema=None):
+    """
+    Reads a sheet from the configured storage backend (AWS S3 by default) into a DataFrame, served from an
+    in-memory cache where possible.
+
+    A cached sheet is returned as is for ttl seconds. After that the object is revalidated with a conditional
+    GET (If-None-Match on the cached ETag): an unchanged object costs one small round trip and no re-parse,
+    a changed one is downloaded and parsed again. The cache is bounded by max_bytes of parsed DataFrame
+    memory and evicts the least recently used sheet first.
+
+    Keys ending in .parquet or .feather are read as columnar exports. A CSV sheet is converted to a local
+    Parquet copy once per object version (requires pyarrow), so a cold start whose object is unchanged reads
+    the copy after a conditional GET instead of downloading and parsing the CSV.
+
+    Parameters:
+    - bucket_name (str): The name of the S3 bucket.
+    - file_key (str): The key (path) to the CSV, Parquet or Feather file in the bucket.
+    - aws_access_key_id (str): AWS Access Key ID with permission to access the bucket.
+    - aws_secret_access_key (str): AWS Secret Access Key corresponding to the Access Key ID.
+    - columns (list of str): Only read these columns. Defaults to all columns.
+    - ttl (float): Seconds a cached sheet is served without asking S3.
+    - max_bytes (int): Upper bound on the memory held by all cached sheets.
+    - schema (dict): Column name -> dtype, e.g. schemas.MAIN_SCHEMA. If given, the sheet is validated and
+      converted with schemas.enforce when it is parsed.
+
+    Returns:
+    - DataFrame: The parsed sheet. It is shared between callers and must be treated as read-only.
+
+    Raises:
+    - schemas.SchemaError: If the sheet does not match the schema.
+    """
+    columns = list(columns) if columns is not None else None
+    cache_key = (bucket_name, file_key, tuple(columns) if columns is not None else None,
+                 tuple(schema.items()) if schema is not None else None)
+    now = time.monotonic()
+
+    with _sheet_cache_lock:
+        entry = _sheet_cache.get(cache_key)
+        if entry is not None:
+            _sheet_cache.move_to_end(cache_key)
+    if entry is not None and now - entry['validated_at'] < ttl:
+        instrumentation.annotate(key=file_key, cache='hit', rows=len(entry['df']))
+        return entry['df']
+
+    copy_path = _columnar_copy_path(bucket_name, file_key, columns, schema)
+    copy_etag = None
+    if entry is not None:
+        etag = entry['etag']
+    elif file_key.endswith('.csv'):
+        etag = copy_etag = _read_columnar_copy(copy_path)
+    else:
+        etag = None
+
+    backend = storage.get_storage(aws_access_key_id, aws_secret_access_key)
+    response = backend.get_object(bucket_name, file_key, if_none_match=etag)
+    if response is None and entry is not None:
+        entry['validated_at'] = now
+        instrumentation.annotate(key=file_key, cache='not-modified', rows=len(entry['df']))
+        return entry['df']
+
+    if response is None:
+        df = pd.read_parquet(copy_path, columns=columns)
+        if schema is not None:
+            df = schemas.enforce(df, schema)
+        instrumentation.annotate(key=file_key, cache='columnar-copy', rows=len(df))
+    else:
+        etag = response.get('ETag')
+        with response['Body'] as body:
+            df = _parse_sheet(body, file_key, columns, schema)
+        instrumentation.annotate(key=file_key, cache='miss', bytes=response.get('ContentLength'), rows=len(df))
+
+        if file_key.endswith('.csv') and etag != copy_etag:
+            _write_columnar_copy(copy_path, df, etag)
+
+    _store_sheet(cache_key, {'etag': etag,
+                             'validated_at': now,
+                             'size': int(df.memory_usage(deep=True).sum()),
+                             'df': df}, max_bytes)
 
     return df
 
 
+@instrumentation.instrumented
+def aggregate_csv_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_access_key, by, values,
+                          chunksize=constants.CSV_CHUNK_ROWS, ttl=constants.S3_CACHE_TTL_SECONDS,
+                          max_bytes=constants.S3_CACHE_MAX_BYTES, schema=None):
+    """
+    Sums columns of a CSV sheet per group while streaming it, for sheets too large to hold as a whole.
+
+    The object is parsed straight from the download stream in chunks of chunksize rows and each chunk is folded
+    into running group totals, so memory is bounded by the chunk size and the number of groups rather than by
+    the file size. Results are cached and revalidated like read_excel_from_s3; use that function when the raw
+    rows are needed.
+
+    Parameters:
+    - bucket_name (str): The name of the S3 bucket.
+    - file_key (str): The key (path) to the CSV file in the bucket.
+    - aws_access_key_id (str): AWS Access Key ID with permission to access the bucket.
+    - aws_secret_access_key (str): AWS Secret Access Key corresponding to the Access Key ID.
+    - by (list of str): The columns to group by, e.g. ['Site', 'Tracer', 'Country'].
+    - values (list of str): The columns to sum.
+    - chunksize (int): Rows parsed per chunk.
+    - ttl (float): Seconds a cached result is served without asking S3.
+    - max_bytes (int): Upper bound on the memory held by all cached sheets.
+    - schema (dict): Column name -> dtype, e.g. schemas.MAIN_SCHEMA. If given, the totals are validated and
+      converted to the dtypes of their columns.
+
+    Returns:
+    - DataFrame: One row per group with the by and values columns. Shared between callers, read-only.
+
+    Raises:
+    - schemas.SchemaError: If the totals do not match the schema.
+    """
+    cache_key = (bucket_name, file_key, ('sum', tuple(by), tuple(values)),
+                 tuple(schema.items()) if schema is not None else None)
+    now = time.monotonic()
+
+    with _sheet_cache_lock:
+        entry = _sheet_cache.get(cache_key)
+        if entry is not None:
+            _sheet_cache.move_to_end(cache_key)
+    if entry is not None and now - entry['validated_at'] < ttl:
+        instrumentation.annotate(key=file_key, cache='hit', rows=len(entry['df']))
+        return entry['df']
+
+    backend = storage.get_storage(aws_access_key_id, aws_secret_access_key)
+    response = backend.get_object(bucket_name, file_key, if_none_match=entry['etag'] if entry else None)
+    if response is None:
+        entry['validated_at'] = now
+        instrumentation.annotate(key=file_key, cache='not-modified', rows=len(entry['df']))
+        return entry['df']
+
+    totals = None
+    rows = 0
+    with response['Body'] as body:
+        for chunk in pd.read_csv(body, usecols=list(by) + list(values), chunksize=chunksize):
+            rows += len(chunk)
+            partial = chunk.groupby(list(by), sort=False)[list(values)].sum()
+            if totals is not None:
+                partial = pd.concat([totals, partial]).groupby(level=list(range(len(by))), sort=False).sum()
+            totals = partial
+
+    if totals is None:
+        df = pd.DataFrame(columns=list(by) + list(values))
+    else:
+        df = totals.reset_index()
+    if schema is not None:
+        df = schemas.enforce(df, {column: dtype for column, dtype in schema.items() if column in df.columns})
+    instrumentation.annotate(key=file_key, cache='miss', bytes=response.get('ContentLength'), rows=rows)
+
+    _store_sheet(cache_key, {'etag': response.get('ETag'),
+                             'validated_at': now,
+                             'size': int(df.memory_usage(deep=True).sum()),
+                             'df': df}, max_bytes)
+
+    return df
+
+
+@instrumentation.instrumented
 def fetch_image_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_access_key):
     """
-    Fetches an image file from AWS S3.
+    Fetches an image file from the configured storage backend (AWS S3 by default).
 
     Parameters:
     - bucket_name (str): The name of the S3 bucket.
@@ -31,14 +279,58 @@ def fetch_image_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_acc
     Returns:
     - Image object (BytesIO): BytesIO object containing the image data.
     """
-    s3 = boto3.client('s3',
-                      aws_access_key_id=aws_access_key_id,
-                      aws_secret_access_key=aws_secret_access_key)
+    backend = storage.get_storage(aws_access_key_id, aws_secret_access_key)
 
-    response = s3.get_object(Bucket=bucket_name, Key=file_key)
-    image_data = response['Body'].read()
+    response = backend.get_object(bucket_name, file_key)
+    with response['Body'] as body:
+        image_data = body.read()
+    instrumentation.annotate(key=file_key, bytes=len(image_data))
     base64_image = base64.b64encode(image_data).decode('utf-8')
 
     return base64_image
 
 
+@instrumentation.instrumented
+def fetch_many(specs, aws_access_key_id, aws_secret_access_key, max_workers=None):
+    """
+    Fetches several S3 objects concurrently, so a page pays roughly one round trip instead of one per object.
+
+    Parameters:
+    - specs (list of tuple): (bucket_name, file_key, loader) triples, where loader is a fetch function with the
+      signature of read_excel_from_s3 / fetch_image_from_s3 that downloads and decodes the object.
+    - aws_access_key_id (str): AWS Access Key ID with permission to access the buckets.
+    - aws_secret_access_key (str): AWS Secret Access Key corresponding to the Access Key ID.
+    - max_workers (int): Number of download threads; defaults to one per spec, capped by the S3 connection pool.
+
+    Returns:
+    - tuple: (results, errors), two dicts keyed by (bucket_name, file_key). results holds the decoded object of
+      every fetch that succeeded, errors the exception raised by every fetch that failed.
+
+    Raises:
+    - ValueError: If two specs name the same object, as their results would overwrite each other.
+    """
+    if not specs:
+        return {}, {}
+    keys = [(bucket_name, file_key) for bucket_name, file_key, _ in specs]
+    if len(set(keys)) != len(keys):
+        duplicates = sorted({key for key in keys if keys.count(key) > 1})
+        raise ValueError("fetch_many got the same object more than once: " +
+                         ", ".join(f"{bucket_name}/{file_key}" for bucket_name, file_key in duplicates))
+    if max_workers is None:
+        max_workers = min(len(specs), constants.S3_MAX_POOL_CONNECTIONS)
+
+    # Each download runs in a copy of the caller's context, so its spans end up in the caller's recording.
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {(bucket_name, file_key): executor.submit(contextvars.copy_context().run, loader, bucket_name,
+                                                            file_key, aws_access_key_id, aws_secret_access_key)
+                   for bucket_name, file_key, loader in specs}
+
+    results, errors = {}, {}
+    for key, future in futures.items():
+        error = future.exception()
+        if error is None:
+            results[key] = future.result()
+        else:
+            errors[key] = error
+
+    return results, errors
@@ -0,0 +1,286 @@
+"""
+Pre-renders the dashboard into a static bundle that any static file server or CDN can serve.
+
+Usage:
+    python export.py --output export
+
+The bundle holds index.html, manifest.json and every figure as Plotly JSON with a content-hashed name, each also
+precompressed as .gz. Exports are incremental: a figure whose inputs did not change since the last export keeps
+its file and is not rebuilt.
+"""
+import argparse
+import gzip
+import hashlib
+import inspect
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+import plotly
+import plotly.offline
+import assets
+import constants
+import data_service
+import figure_cache
+import metrics
+import plots
+
+
+MANIFEST_NAME = 'manifest.json'
+INDEX_NAME = 'index.html'
+
+INDEX_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>LION data overview</title>
+<link rel="icon" href="data:image/svg+xml,<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 100 100'><text y='.9em' font-size='90'>🦁</text></svg>">
+<style>
+  body { background: #0E1117; color: white; font-family: sans-serif; margin: 0 auto; max-width: 1500px; }
+  header { display: flex; align-items: center; justify-content: center; gap: 24px; }
+  header .enhance { position: absolute; top: 0; left: 0; width: 175px; height: 175px; }
+  header .lion { width: 400px; height: auto; border-radius: 50%; margin-right: -120px; }
+  .caption { text-align: center; color: #999; font-size: 14px; }
+  .models { display: flex; justify-content: center; gap: 48px; flex-wrap: wrap; }
+  .model { flex: 0 1 450px; text-align: center; }
+  .progress { width: 100%; background: #ddd; border-radius: 5px; }
+  .progress div { height: 30px; line-height: 30px; background: #ff69b4; color: white; font-weight: bold;
+                  border-radius: 5px; }
+  .holdout { font-size: 48px; font-weight: bold; margin-top: 10px; }
+</style>
+</head>
+<body>
+<header>
+  <a href="https://www.enhance.pet" target="_blank" rel="noopener noreferrer"><img class="enhance" id="enhance-logo"></a>
+  <a href="https://github.com/LalithShiyam/LION" target="_blank"><img class="lion" id="lion-logo" alt="Logo"></a>
+  <h1>LION Data Dashboard</h1>
+</header>
+<p class="caption" id="caption"></p>
+<div id="site_bar"></div>
+<div id="world_map"></div>
+<div class="models" id="models"></div>
+<script>
+function loadScript(src) {
+  return new Promise((resolve, reject) => {
+    const script = document.createElement('script');
+    script.src = src;
+    script.onload = resolve;
+    script.onerror = reject;
+    document.head.appendChild(script);
+  });
+}
+
+async function plot(id, file) {
+  const figure = await (await fetch(file)).json();
+  Plotly.newPlot(id, figure.data, figure.layout, {responsive: true});
+}
+
+async function render() {
+  const manifest = await (await fetch('manifest.json', {cache: 'no-cache'})).json();
+  document.getElementById('enhance-logo').src = manifest.logos.enhance;
+  document.getElementById('lion-logo').src = manifest.logos.lion;
+  document.getElementById('caption').textContent =
+    `Data from ${manifest.source}, exported ${new Date(manifest.exported_at * 1000).toLocaleString()}`;
+
+  const models = document.getElementById('models');
+  for (const model of manifest.models) {
+    const share = model.total_cases ? model.verified / model.total_cases : null;
+    const progress = share === null ? `<p><strong>No target set</strong> (${model.verified} segmented cases)</p>` : `
+      <div id="gauge_${model.key}"></div>
+      <p><strong>Segmented cases</strong></p>
+      <div class="progress"><div style="width: ${(share * 100).toFixed(1)}%">${(share * 100).toFixed(1)}%</div></div>
+      <p><strong>${(share * 100).toFixed(1)}%</strong> (${model.verified} of ${model.total_cases})</p>`;
+    const section = document.createElement('div');
+    section.className = 'model';
+    section.innerHTML = `
+      <h2>${model.tracer} model</h2>
+      ${progress}
+      <p>Number of cases for <span style="color:#ff69b4;"><strong>${model.tracer} holdout</strong></span></p>
+      <div class="holdout">${model.holdout_verified}</div>
+      <div id="holdout_${model.key}"></div>`;
+    models.appendChild(section);
+  }
+
+  await loadScript(manifest.plotlyjs);
+  await Promise.all(Object.entries(manifest.figures).map(([id, figure]) => plot(id, figure.file)));
+}
+
+render();
+</script>
+</body>
+</html>
+"""
+
+
+def _write(path, data):
+    """
+    Writes bytes atomically, so a server never hands out a partially written file.
+    """
+    with open(path + '.tmp', 'wb') as file:
+        file.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def _write_hashed(output_dir, stem, extension, data):
+    """
+    Writes data as <stem>-<content hash><extension> together with a gzip copy, unless that file already exists.
+
+    Returns:
+    - str: The file name, relative to the bundle.
+    """
+    file_name = f"{stem}-{hashlib.sha256(data).hexdigest()[:16]}{extension}"
+    path = os.path.join(output_dir, file_name)
+    if not os.path.exists(path):
+        _write(path, data)
+        # mtime=0 keeps the compressed copy byte-identical across exports.
+        _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    return file_name
+
+
+def _load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _bundle_files(manifest):
+    files = {manifest.get('plotlyjs'), *manifest.get('logos', {}).values(),
+             *(entry['file'] for entry in manifest.get('figures', {}).values())}
+    files.discard(None)
+    return files
+
+
+def _models(data):
+    """
+    Returns (tracer, number of cases its model aims for) for every tracer of the data, as shown by the dashboard.
+    """
+    return [(tracer, constants.TARGET_CASES.get(tracer, data.summary.expected(tracer)))
+            for tracer in data.drill_down.tracers]
+
+
+def _figure_specs(summary, models):
+    """
+    Returns name -> (builder, args, kwargs) for every figure of the dashboard.
+    """
+    specs = {
+        'site_bar': (plots.horizontal_stacked_bar_chart, (summary.sites,), {'top_n': constants.SITE_BAR_TOP_N}),
+        'world_map': (plots.world_map_plot, (summary.countries,), {}),
+    }
+    holdout_tracers = summary.holdout_sites.index.get_level_values('Tracer')
+    for tracer, total_cases in models:
+        key = metrics.slug(tracer)
+        # A tracer without a target gets no gauge, as on the dashboard.
+        if total_cases:
+            specs[f'gauge_{key}'] = (plots.speedometer, (summary.curated(tracer), total_cases), {})
+        # Each holdout chart gets only its tracer's rows, so a change to one tracer does not rebuild the others.
+        holdout_sites = summary.holdout_sites[holdout_tracers == tracer]
+        specs[f'holdout_{key}'] = (plots.stacked_bar_holdout_per_tracer, (holdout_sites, tracer), {})
+    return specs
+
+
+def _inputs_fingerprint(builder, args, kwargs):
+    """
+    Fingerprints a figure by the content of its arguments and the source of the module of its builder (builders
+    share helpers), so the figure is rebuilt when either changes.
+    """
+    parts = [builder.__qualname__, inspect.getsource(inspect.getmodule(inspect.unwrap(builder)))]
+    parts += [figure_cache.fingerprint(arg) for arg in args]
+    parts += [f"{name}={figure_cache.fingerprint(arg)}" for name, arg in sorted(kwargs.items())]
+    return figure_cache.fingerprint(tuple(parts))
+
+
+def _copy_logo(output_dir, url):
+    """
+    Copies a logo published by assets.logo_url into the bundle. Its name is already content-hashed.
+    """
+    file_name = os.path.basename(url)
+    path = os.path.join(output_dir, file_name)
+    if not os.path.exists(path):
+        shutil.copyfile(os.path.join(assets.STATIC_DIR, file_name), path)
+    return file_name
+
+
+def export_bundle(output_dir, aws_access_key_id, aws_secret_access_key, force=False):
+    """
+    Loads the data once, renders every figure that changed since the last export and writes the bundle.
+
+    Parameters:
+    - output_dir (str): The bundle directory; created if missing.
+    - aws_access_key_id (str): AWS Access Key ID with permission to access the bucket.
+    - aws_secret_access_key (str): AWS Secret Access Key corresponding to the Access Key ID.
+    - force (bool): Rebuild every figure even if its inputs did not change.
+
+    Returns:
+    - dict: The new manifest, with the names of the rebuilt figures under 'rebuilt'.
+    """
+    service = data_service.DataService(aws_access_key_id, aws_secret_access_key)
+    if not service.refresh():
+        raise RuntimeError("Could not load " + ", ".join(f"{key} ({error})"
+                                                         for key, error in service.last_errors.items()))
+    data = service.snapshot()
+    summary = data.summary
+    models = _models(data)
+
+    os.makedirs(output_dir, exist_ok=True)
+    previous_manifest = _load_manifest(output_dir)
+    previous = {} if force else previous_manifest.get('figures', {})
+
+    figures = {}
+    rebuilt = []
+    for name, (builder, args, kwargs) in _figure_specs(summary, models).items():
+        inputs = _inputs_fingerprint(builder, args, kwargs)
+        entry = previous.get(name)
+        if entry and entry.get('inputs') == inputs and os.path.exists(os.path.join(output_dir, entry['file'])):
+            figures[name] = entry
+            continue
+        fig = builder(*args, **kwargs)
+        figures[name] = {'inputs': inputs,
+                         'file': _write_hashed(output_dir, name, '.json', figure_cache.to_json(fig).encode())}
+        rebuilt.append(name)
+
+    manifest = {
+        'source': data.main_sheet_key,
+        'exported_at': time.time(),
+        'plotlyjs': _write_hashed(output_dir, f"plotly-{plotly.__version__}", '.min.js',
+                                  plotly.offline.get_plotlyjs().encode()),
+        'logos': {'enhance': _copy_logo(output_dir, data.enhance_logo),
+                  'lion': _copy_logo(output_dir, data.lion_logo)},
+        'models': [{'tracer': tracer, 'key': metrics.slug(tracer), 'total_cases': total_cases,
+                    'verified': summary.verified(tracer), 'curated': summary.curated(tracer),
+                    'holdout_verified': summary.holdout_verified(tracer)}
+                   for tracer, total_cases in models],
+        'figures': figures,
+    }
+
+    _write(os.path.join(output_dir, INDEX_NAME), INDEX_HTML.encode())
+    _write(os.path.join(output_dir, MANIFEST_NAME), json.dumps(manifest, indent=2).encode())
+
+    # Remove the files of the previous export that the new manifest no longer references.
+    for file_name in _bundle_files(previous_manifest) - _bundle_files(manifest):
+        for path in (file_name, file_name + '.gz'):
+            if os.path.exists(os.path.join(output_dir, path)):
+                os.remove(os.path.join(output_dir, path))
+
+    return dict(manifest, rebuilt=rebuilt)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', default=constants.EXPORT_DIR, help="bundle directory")
+    parser.add_argument('--force', action='store_true', help="rebuild every figure")
+    args = parser.parse_args(argv)
+
+    manifest = export_bundle(args.output, os.getenv('AWS_ACCESS_KEY_ID'), os.getenv('AWS_SECRET_ACCESS_KEY'),
+                             force=args.force)
+    rebuilt = manifest['rebuilt']
+    print(f"Exported {manifest['source']} to {args.output}: rebuilt {len(rebuilt)} of "
+          f"{len(manifest['figures'])} figures" + (f" ({', '.join(rebuilt)})" if rebuilt else ""))
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    sys.exit(main())
@@ -0,0 +1,146 @@
+from collections import OrderedDict
+import functools
+import hashlib
+import threading
+import pandas as pd
+import constants
+import instrumentation
+
+
+# cache key -> (figure, size of its JSON in bytes), least recently used first.
+_figures = OrderedDict()
+# id of every figure held by _figures -> its JSON, made once when it was cached.
+_payloads = {}
+_figures_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def fingerprint(value):
+    """
+    Returns a short, content-based fingerprint of a builder argument.
+
+    DataFrames and Series are hashed by their values, index and column labels, so equal frames share a
+    fingerprint even if they are different objects. Other values are fingerprinted by their repr.
+
+    Parameters:
+    - value: The argument.
+
+    Returns:
+    - str: A hex digest.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest.update(type(value).__name__.encode())
+        labels = value.columns if isinstance(value, pd.DataFrame) else [value.name]
+        digest.update(repr(list(labels)).encode())
+        digest.update(repr(list(value.index.names)).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    else:
+        digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+def _members(fig):
+    return fig.values() if isinstance(fig, dict) else [fig]
+
+
+def _evict(max_bytes):
+    total = sum(size for _, size in _figures.values())
+    while total > max_bytes and _figures:
+        _, (fig, size) = _figures.popitem(last=False)
+        for each in _members(fig):
+            _payloads.pop(id(each), None)
+        total -= size
+        _stats['evictions'] += 1
+
+
+def to_json(fig):
+    """
+    Returns the JSON of a figure, reusing the copy made when the figure was cached.
+
+    Parameters:
+    - fig (plotly.graph_objs._figure.Figure): The figure.
+
+    Returns:
+    - str: The figure as Plotly JSON.
+    """
+    with _figures_lock:
+        payload = _payloads.get(id(fig))
+    return payload if payload is not None else fig.to_json()
+
+
+def figure_payload(fig):
+    return {'payload_bytes': len(to_json(fig))}
+
+
+def figures_payload(figures):
+    return {'payload_bytes': sum(len(to_json(fig)) for fig in figures.values()), 'figures': len(figures)}
+
+
+def cached_figure(builder):
+    """
+    Memoizes a figure builder on the content of its arguments.
+
+    A repeated call with equal arguments returns the figure built the first time and skips figure construction
+    and Plotly validation. Cached figures are shared between callers and must not be modified. Each figure is
+    serialized once when cached; to_json hands out that copy. The cache holds at most
+    constants.FIGURE_CACHE_MAX_BYTES of serialized figures and evicts the least recently used first.
+
+    Parameters:
+    - builder (callable): A function returning a plotly Figure, or a dict of Figures.
+
+    Returns:
+    - callable: The memoized builder.
+    """
+    @functools.wraps(builder)
+    def wrapper(*args, **kwargs):
+        key = (builder.__qualname__,
+               tuple(fingerprint(arg) for arg in args),
+               tuple(sorted((name, fingerprint(arg)) for name, arg in kwargs.items())))
+
+        with _figures_lock:
+            cached = _figures.get(key)
+            if cached is not None:
+                _figures.move_to_end(key)
+                _stats['hits'] += 1
+                instrumentation.annotate(cache='hit')
+                return cached[0]
+            _stats['misses'] += 1
+        instrumentation.annotate(cache='miss')
+
+        fig = builder(*args, **kwargs)
+        payloads = {id(each): each.to_json() for each in _members(fig)}
+
+        with _figures_lock:
+            if key in _figures:
+                # Another session built the same figure meanwhile; keep the cached one.
+                _figures.move_to_end(key)
+                return _figures[key][0]
+            _figures[key] = (fig, sum(len(payload) for payload in payloads.values()))
+            _payloads.update(payloads)
+            _evict(constants.FIGURE_CACHE_MAX_BYTES)
+        return fig
+
+    return wrapper
+
+
+def stats():
+    """
+    Returns the hit, miss and eviction counters of the figure cache along with its current size.
+
+    Returns:
+    - dict: 'hits', 'misses', 'evictions', 'entries' and 'bytes'.
+    """
+    with _figures_lock:
+        return dict(_stats, entries=len(_figures), bytes=sum(size for _, size in _figures.values()))
+
+
+def clear():
+    """
+    Drops every cached figure and resets the counters.
+    """
+    with _figures_lock:
+        _figures.clear()
+        _payloads.clear()
+        for name in _stats:
+            _stats[name] = 0
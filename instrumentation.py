@@ -0,0 +1,111 @@
+from contextlib import contextmanager
+import contextvars
+import functools
+import json
+import logging
+import time
+import constants
+
+
+logger = logging.getLogger('lion.perf')
+if constants.PERF_LOGGING and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+# The list spans of the current render are appended to, or None if nothing is recorded.
+_records = contextvars.ContextVar('lion_perf_records', default=None)
+# The record of the innermost open span.
+_current = contextvars.ContextVar('lion_perf_span', default=None)
+
+
+def start_recording(enabled=True):
+    """
+    Starts collecting the spans of the current render, e.g. for the performance panel.
+
+    Parameters:
+    - enabled (bool): Whether to record. With False (and LION_PERF unset) spans cost next to nothing.
+
+    Returns:
+    - list of dict or None: The list the spans are appended to as they finish.
+    """
+    records = [] if enabled else None
+    _records.set(records)
+    return records
+
+
+def is_enabled():
+    return constants.PERF_LOGGING or _records.get() is not None
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Times a block and records it with its wall time and any attributes added through annotate.
+
+    Finished spans are logged as one JSON object per line to the 'lion.perf' logger and appended to the
+    records of start_recording. When neither is active the block runs without any bookkeeping.
+
+    Parameters:
+    - name (str): The name of the span, e.g. 'download_data.read_excel_from_s3'.
+    - attributes: Initial attributes of the span.
+    """
+    if not is_enabled():
+        yield None
+        return
+
+    record = dict(attributes, name=name)
+    token = _current.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.setdefault('wall_ms', round((time.perf_counter() - start) * 1000, 3))
+        _current.reset(token)
+        logger.info(json.dumps(record, default=str))
+        records = _records.get()
+        if records is not None:
+            records.append(record)
+
+
+def annotate(**attributes):
+    """
+    Adds attributes such as bytes transferred or rows read to the innermost open span, if any.
+    """
+    record = _current.get()
+    if record is not None:
+        record.update(attributes)
+
+
+def instrumented(function=None, measure=None):
+    """
+    Wraps a function in a span named after its module and name.
+
+    Parameters:
+    - function (callable): The function to wrap.
+    - measure (callable): Optional measure(result) returning extra attributes for the span, only called while
+      recording, e.g. the figure payload size.
+
+    Returns:
+    - callable: The wrapped function.
+    """
+    if function is None:
+        return functools.partial(instrumented, measure=measure)
+
+    name = f"{function.__module__}.{function.__name__}"
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not is_enabled():
+            return function(*args, **kwargs)
+        with span(name) as record:
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            if measure is not None:
+                # Measuring (e.g. serializing a figure) is not part of the function's wall time.
+                record['wall_ms'] = round((time.perf_counter() - start) * 1000, 3)
+                record.update(measure(result))
+        return result
+
+    return wrapper
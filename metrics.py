@@ -0,0 +1,353 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import re
+import threading
+import weakref
+import numpy as np
+import pandas as pd
+import constants
+import instrumentation
+import schemas
+
+
+COUNT_COLUMNS = ["Number of expected cases", "Number of verified cases", "Number of curated cases"]
+HOLDOUT_COUNT_COLUMNS = ["Number of expected cases", "Number of verified cases"]
+# The columns the dashboard reads from each sheet.
+MAIN_COLUMNS = list(schemas.MAIN_SCHEMA)
+HOLDOUT_COLUMNS = list(schemas.HOLDOUT_SCHEMA)
+
+# The columns the drill-down filters each sheet by.
+FILTER_COLUMNS = ["Tracer", "Country", "Site"]
+HOLDOUT_FILTER_COLUMNS = ["Tracer", "Site"]
+
+# Weak references to the frames of the last compute_metrics call and its result.
+_last_metrics = None
+_last_metrics_lock = threading.Lock()
+# Weak references to the frames of the last drill_down call and its DrillDown.
+_last_drill_down = None
+_last_drill_down_lock = threading.Lock()
+
+
+def slug(name):
+    """
+    Turns a tracer or site name into an identifier that is safe in CSS class names, HTML ids and widget keys.
+
+    Parameters:
+    - name (str): The name, e.g. 'Ga-68 PSMA'.
+
+    Returns:
+    - str: Lowercase letters and digits joined by dashes, e.g. 'ga-68-psma'.
+    """
+    return re.sub(r'[^a-z0-9]+', '-', str(name).lower()).strip('-')
+
+
+@dataclass(frozen=True)
+class DashboardMetrics:
+    """
+    Every aggregate the dashboard page needs, computed once per pair of input frames.
+
+    The frames are shared between sessions and must be treated as read-only.
+
+    Attributes:
+    - tracers (DataFrame): Case counts per Tracer (index), one column per entry of COUNT_COLUMNS.
+    - sites (DataFrame): 'Site' and 'Number of expected cases' over all tracers, ordered by Site.
+    - countries (DataFrame): 'Country', 'Site' (site names joined with '<br>') and 'Number of expected cases'.
+    - holdout_tracers (DataFrame): Holdout case counts per Tracer (index).
+    - holdout_sites (DataFrame): Holdout case counts per (Tracer, Site) index.
+    """
+    tracers: pd.DataFrame
+    sites: pd.DataFrame
+    countries: pd.DataFrame
+    holdout_tracers: pd.DataFrame
+    holdout_sites: pd.DataFrame
+
+    def _count(self, frame, tracer, column):
+        return int(frame[column].get(tracer, 0))
+
+    def expected(self, tracer):
+        return self._count(self.tracers, tracer, "Number of expected cases")
+
+    def verified(self, tracer):
+        return self._count(self.tracers, tracer, "Number of verified cases")
+
+    def curated(self, tracer):
+        return self._count(self.tracers, tracer, "Number of curated cases")
+
+    def holdout_verified(self, tracer):
+        return self._count(self.holdout_tracers, tracer, "Number of verified cases")
+
+
+def aggregate_sites(df, max_sites=constants.MAP_MAX_SITES_PER_COUNTRY):
+    """
+    Aggregates site information for each country into a single string.
+
+    Parameters:
+    - df (DataFrame): The DataFrame containing 'Country', 'Site', and 'Number of expected cases'.
+    - max_sites (int): At most this many sites are named per country; the rest are summarized as '… and N more'.
+
+    Returns:
+    - DataFrame: A DataFrame with aggregated site information, one row per country ordered by Country. Sites
+      listed on several rows are named once.
+    """
+    # Countries are ordered by value on both sides: a categorical export may list its categories in any order.
+    expected = df.groupby('Country', observed=True)['Number of expected cases'].sum()
+    expected.index = expected.index.astype(object)
+    expected = expected.sort_index()
+
+    # One row per (Country, Site) in order of appearance within each country
+    pairs = df[['Country', 'Site']].dropna(subset=['Country']).drop_duplicates()
+    countries = pairs['Country'].to_numpy(dtype=object)
+    order = np.argsort(countries, kind='stable')
+    countries = countries[order]
+    names = pairs['Site'].to_numpy(dtype=object)[order]
+    # Group boundaries are taken from the sorted array itself
+    starts = np.flatnonzero(np.r_[True, countries[1:] != countries[:-1]]) if len(countries) else np.empty(0, int)
+    counts = np.diff(np.r_[starts, len(countries)])
+
+    # Keep the first max_sites sites of every country
+    rank = np.arange(len(names)) - np.repeat(starts, counts)
+    shown = rank < max_sites
+    shown_counts = np.minimum(counts, max_sites)
+    shown_starts = np.cumsum(shown_counts) - shown_counts
+
+    # Join each country's site names with '<br>' in a single reduceat over the flat array
+    pieces = '<br>' + names[shown].astype(str).astype(object)
+    pieces[shown_starts] = names[shown][shown_starts]
+    labels = np.add.reduceat(pieces, shown_starts) if len(pieces) else []
+    hidden = counts - shown_counts
+    labels = [label + f'<br>… and {more} more' if more else label for label, more in zip(labels, hidden)]
+
+    grouped = pd.DataFrame({
+        'Country': expected.index,
+        'Site': labels,
+        'Number of expected cases': expected.to_numpy()
+    })
+
+    return grouped
+
+
+def _compute_metrics(df, holdout_df):
+    # The only pass over the main sheet; everything below works on one row per (Tracer, Site, Country).
+    grouped = df.groupby(["Tracer", "Site", "Country"], sort=False, observed=True)[COUNT_COLUMNS].sum()
+    flat = grouped.reset_index()
+
+    tracers = grouped.groupby(level="Tracer", observed=True).sum()
+    sites = flat.groupby("Site", observed=True)["Number of expected cases"].sum().reset_index()
+    countries = aggregate_sites(flat)
+
+    # The only pass over the holdout sheet.
+    holdout_sites = holdout_df.groupby(["Tracer", "Site"], observed=True)[HOLDOUT_COUNT_COLUMNS].sum()
+    holdout_tracers = holdout_sites.groupby(level="Tracer", observed=True).sum()
+
+    return DashboardMetrics(tracers=tracers, sites=sites, countries=countries,
+                            holdout_tracers=holdout_tracers, holdout_sites=holdout_sites)
+
+
+@instrumentation.instrumented
+def compute_metrics(df, holdout_df):
+    """
+    Computes every per-tracer, per-site and per-country aggregate of the dashboard in one grouped pass per frame.
+
+    The result of the last call is reused as long as the same frame objects are passed in again, which is the
+    case while download_data serves the sheets from its cache.
+
+    Parameters:
+    - df (DataFrame): The main sheet with 'Site', 'Country', 'Tracer' and the COUNT_COLUMNS.
+    - holdout_df (DataFrame): The holdout sheet with 'Site', 'Tracer' and the HOLDOUT_COUNT_COLUMNS.
+
+    Returns:
+    - DashboardMetrics: The aggregates.
+    """
+    global _last_metrics
+
+    with _last_metrics_lock:
+        if _last_metrics is not None:
+            df_ref, holdout_ref, metrics = _last_metrics
+            if df_ref() is df and holdout_ref() is holdout_df:
+                return metrics
+
+    metrics = _compute_metrics(df, holdout_df)
+    instrumentation.annotate(rows=len(df) + len(holdout_df))
+
+    with _last_metrics_lock:
+        _last_metrics = (weakref.ref(df), weakref.ref(holdout_df), metrics)
+
+    return metrics
+
+
+class _ColumnIndex:
+    """
+    The row positions of every value of one column, grouped by value, and the value code of every row.
+    """
+
+    def __init__(self, values):
+        codes, uniques = pd.factorize(values, sort=True)
+        self.codes = codes
+        self.values = list(uniques)
+        self.code_of = {value: code for code, value in enumerate(self.values)}
+        present = codes >= 0
+        order = np.flatnonzero(present)[np.argsort(codes[present], kind='stable')]
+        bounds = np.cumsum(np.bincount(codes[present], minlength=len(self.values)))[:-1]
+        self.positions = np.split(order, bounds) if len(self.values) else []
+
+    def size(self, selected):
+        return sum(len(self.positions[self.code_of[value]]) for value in selected if value in self.code_of)
+
+    def values_at(self, rows):
+        """
+        Returns the distinct values of the given rows in sorted order.
+        """
+        return [self.values[code] for code in np.unique(self.codes[rows]) if code >= 0]
+
+    def rows(self, selected):
+        """
+        Returns the sorted row positions holding any of the selected values.
+        """
+        chosen = [self.positions[self.code_of[value]] for value in selected if value in self.code_of]
+        return np.sort(np.concatenate(chosen)) if chosen else np.empty(0, dtype=np.intp)
+
+    def contains(self, rows, selected):
+        """
+        Returns a mask telling which of the given rows hold one of the selected values.
+        """
+        codes = [self.code_of[value] for value in selected if value in self.code_of]
+        return np.isin(self.codes[rows], codes)
+
+
+def _matching_rows(indexes, selection):
+    """
+    Returns the sorted positions of the rows matching every non-empty selection, or None if nothing is selected.
+
+    Only the rows of the most selective column are gathered; the other columns are checked on those rows alone,
+    so the cost grows with the number of matching rows rather than with the sheet.
+    """
+    selected = {column: values for column, values in selection.items() if values}
+    if not selected:
+        return None
+    first = min(selected, key=lambda column: indexes[column].size(selected[column]))
+    rows = indexes[first].rows(selected[first])
+    for column, values in selected.items():
+        if column != first:
+            rows = rows[indexes[column].contains(rows, values)]
+    return rows
+
+
+class DrillDown:
+    """
+    Aggregates of the sheets filtered by tracer, country and site, served from an index built once per frame.
+
+    Each filter combination is aggregated once and kept in a bounded least recently used cache, so switching back
+    to a combination costs a dictionary lookup and the figure builders see the very same frames again.
+    """
+
+    def __init__(self, df, holdout_df, max_cached=constants.DRILL_DOWN_CACHE_SIZE):
+        self.df = df
+        self.holdout_df = holdout_df
+        self.max_cached = max_cached
+        self._main = {column: _ColumnIndex(df[column]) for column in FILTER_COLUMNS}
+        self._holdout = {column: _ColumnIndex(holdout_df[column]) for column in HOLDOUT_FILTER_COLUMNS}
+        self._metrics = OrderedDict()
+        self._metrics_lock = threading.Lock()
+
+    @property
+    def tracers(self):
+        """
+        The tracers of the main sheet in sorted order.
+        """
+        return self._main["Tracer"].values
+
+    def options(self, column, tracers=(), countries=(), sites=()):
+        """
+        Returns the values of a filter column that occur in the rows matching the other filters.
+
+        Parameters:
+        - column (str): 'Tracer', 'Country' or 'Site'.
+        - tracers, countries, sites (iterable of str): The current selection; an empty selection matches all.
+
+        Returns:
+        - list: The values in sorted order.
+        """
+        selection = {"Tracer": tracers, "Country": countries, "Site": sites}
+        selection[column] = ()
+        rows = _matching_rows(self._main, selection)
+        if rows is None:
+            return self._main[column].values
+        return self._main[column].values_at(rows)
+
+    def _holdout_rows(self, tracers, countries, sites):
+        if countries:
+            # The holdout sheet has no Country column; a country selects the sites the main sheet lists for it.
+            country_sites = self._main["Site"].values_at(self._main["Country"].rows(countries))
+            if sites:
+                wanted = set(sites)
+                sites = [site for site in country_sites if site in wanted]
+            else:
+                sites = country_sites
+            if not sites:
+                return np.empty(0, dtype=np.intp)
+        return _matching_rows(self._holdout, {"Tracer": tracers, "Site": sites})
+
+    @instrumentation.instrumented
+    def filtered_metrics(self, tracers=(), countries=(), sites=()):
+        """
+        Returns the aggregates of the rows matching the selection.
+
+        Parameters:
+        - tracers (iterable of str): Only these tracers; empty for all.
+        - countries (iterable of str): Only sites in these countries; empty for all.
+        - sites (iterable of str): Only these sites; empty for all.
+
+        Returns:
+        - DashboardMetrics: The aggregates, shared between callers and read-only.
+        """
+        key = (tuple(sorted(tracers)), tuple(sorted(countries)), tuple(sorted(sites)))
+        if not any(key):
+            return compute_metrics(self.df, self.holdout_df)
+
+        with self._metrics_lock:
+            cached = self._metrics.get(key)
+            if cached is not None:
+                self._metrics.move_to_end(key)
+                instrumentation.annotate(cache='hit')
+                return cached
+
+        rows = _matching_rows(self._main, {"Tracer": key[0], "Country": key[1], "Site": key[2]})
+        holdout_rows = self._holdout_rows(*key)
+        holdout_df = self.holdout_df if holdout_rows is None else self.holdout_df.take(holdout_rows)
+        metrics = _compute_metrics(self.df.take(rows), holdout_df)
+        instrumentation.annotate(cache='miss', rows=len(rows) + len(holdout_df))
+
+        with self._metrics_lock:
+            self._metrics[key] = metrics
+            while len(self._metrics) > self.max_cached:
+                self._metrics.popitem(last=False)
+        return metrics
+
+
+@instrumentation.instrumented
+def drill_down(df, holdout_df):
+    """
+    Returns the DrillDown of a pair of sheets, reusing the last one (and its cached slices) for the same frames.
+
+    Parameters:
+    - df (DataFrame): The main sheet with the FILTER_COLUMNS and COUNT_COLUMNS.
+    - holdout_df (DataFrame): The holdout sheet with the HOLDOUT_FILTER_COLUMNS and HOLDOUT_COUNT_COLUMNS.
+
+    Returns:
+    - DrillDown: The indexed sheets.
+    """
+    global _last_drill_down
+
+    with _last_drill_down_lock:
+        if _last_drill_down is not None:
+            df_ref, holdout_ref, cached = _last_drill_down
+            if df_ref() is df and holdout_ref() is holdout_df:
+                return cached
+
+    drill = DrillDown(df, holdout_df)
+    instrumentation.annotate(rows=len(df) + len(holdout_df))
+
+    with _last_drill_down_lock:
+        _last_drill_down = (weakref.ref(df), weakref.ref(holdout_df), drill)
+
+    return drill
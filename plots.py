@@ -1,44 +1,28 @@
-import streamlit as st
-import pandas as pd
-import altair as alt
-import plotly.express as px
+import plotly.colors
 import plotly.graph_objects as go
-import constants
+import figure_cache
+from figure_cache import cached_figure
+import instrumentation
 import numpy as np
+from functools import lru_cache
 
 
-def aggregate_sites(df):
-    """
-    Aggregates site information for each country into a single string.
+GAUGE_START_COLOR = "#8c52ff"
+GAUGE_END_COLOR = "#ff5757"
+OTHER_COLOR = "#6c757d"
 
-    Parameters:
-    - df (DataFrame): The DataFrame containing 'Country', 'Site', and 'Number of expected cases'.
 
-    Returns:
-    - DataFrame: A DataFrame with aggregated site information.
+@lru_cache(maxsize=1)
+def _base_world_map():
+    """
+    Builds the static part of the world map (geo layout and choropleth styling) once per process.
     """
-    # Group by 'Country' and aggregate sites
-    grouped = df.groupby('Country').agg({
-        'Site': lambda x: '<br>'.join(x),
-        'Number of expected cases': 'sum'
-    }).reset_index()
-
-    return grouped
-
-
-def world_map_plot(df):
-
-    aggregated_df = aggregate_sites(df)
-
     fig = go.Figure(data=go.Choropleth(
-        locations=aggregated_df['Country'],
-        z=aggregated_df['Number of expected cases'],
-        text=aggregated_df['Site'],
         autocolorscale=False,
         marker_line_color='darkgray',
         marker_line_width=0.5,
         colorbar=dict(title=None),
-        colorscale=px.colors.sequential.Plasma,
+        colorscale=plotly.colors.sequential.Plasma,
         showscale=True,
 
     ))
@@ -62,75 +46,58 @@ def world_map_plot(df):
 
     return fig
 
-def donut_plot(df, target_column, expected_total):
-
-    sum_values = df[target_column].sum()
-    remaining_value = expected_total - sum_values
-    pastel_colors = ['#BCABAE', '#0F0F0F']
-    plot_data = pd.DataFrame({"Category": ["Curated", "Remaining"],
-                              "Value": [sum_values, remaining_value]})
-
-    plot_data['percentage'] = (plot_data['Value'] / expected_total) * 100
-
-    plot = alt.Chart(plot_data, autosize="fit").mark_arc(innerRadius=70).encode(
-        theta=alt.Theta(field="Value", type="quantitative", stack=True),
-        color = alt.Color(field='Category', type='nominal', scale=alt.Scale(range=pastel_colors), legend=alt.Legend(title='Category')),
-        tooltip=[alt.Tooltip(field='Category', type='nominal', title='Category'),
-                 alt.Tooltip(field='Value', type='quantitative', title='Value'),
-                 alt.Tooltip(field='percentage', type='quantitative', title='Percentage')]
-    ).properties(width=200,
-                 height=200
-    ).configure_view(
-        clip=False,
-        strokeOpacity=0  # Remove the border around the plot area
-    )
-    return plot
 
-
-def create_stacked_vertical_bar_chart(df, max_value, bar_height=200, bar_width=40):
+@instrumentation.instrumented(measure=figure_cache.figure_payload)
+@cached_figure
+def world_map_plot(country_df):
     """
-    Creates a vertical stacked bar chart representing progress.
+    Creates a choropleth of the expected cases per country.
+
+    The base map is built once per process; each call copies it and only sets the locations, z and text arrays.
 
     Parameters:
-    - df (DataFrame): The DataFrame containing the data.
-    - max_value (float): The maximum value for the progress.
-    - bar_height (int): The height of the vertical bar chart.
-    - bar_width (int): The width of the vertical bar chart.
-    - title (str): Optional title displayed above the bar chart.
+    - country_df (DataFrame): Per-country aggregates with 'Country', 'Site' and 'Number of expected cases',
+      as in DashboardMetrics.countries.
+
+    Returns:
+    - fig (plotly.graph_objs._figure.Figure): The choropleth figure.
     """
-    value = df["Number of verified cases"].sum()
-    remaining_value = max_value - value
-    progress_percentage = value / max_value  # Calculate the progress percentage
-
-    # Create the data for the stacked bar chart
-    bar_data = pd.DataFrame({
-        'Category': ['Completed', 'Remaining'],
-        'Value': [value, remaining_value]
-    })
-
-    # Create the stacked bar chart using Altair
-    bar_chart = alt.Chart(bar_data).mark_bar(size=bar_width).encode(
-        x=alt.X('Category:N', title='', axis=None),  # Hide x-axis
-        y=alt.Y('Value:Q', scale=alt.Scale(domain=[0, max_value]), title='', axis=None),  # Hide y-axis
-        color=alt.Color('Category:N', scale=alt.Scale(domain=['Completed', 'Remaining'], range=['#e55f42', '#e0e0e0']),
-                        legend=None)
-    ).properties(
-        width=bar_width,
-        height=bar_height
-    ).configure_view(
-        strokeWidth=0  # Remove the border around the plot
+    fig = go.Figure(_base_world_map())
+    fig.data[0].update(
+        locations=country_df['Country'].to_numpy(),
+        z=country_df['Number of expected cases'].to_numpy(),
+        text=country_df['Site'].to_numpy()
     )
 
-    return bar_chart
+    return fig
 
-def speedometer(df, total_cases, steps=1000):
+@instrumentation.instrumented(measure=figure_cache.figure_payload)
+@cached_figure
+def speedometer(value, total_cases, steps=None):
+    """
+    Creates a gauge of the curated cases with a purple to red gradient band.
 
-    value = df["Number of curated cases"].sum()
-    gradient_colors = generate_gradient_colors("#8c52ff", "#ff5757", steps)
+    Parameters:
+    - value (int): The number of curated cases.
+    - total_cases (int): The upper end of the gauge.
+    - steps (int): Number of gradient steps. By default one step per distinct 8-bit color of the gradient,
+      which looks identical to any finer split while keeping the figure JSON small.
 
-    step_ranges = [(i * total_cases / steps, (i + 1) * total_cases / steps) for i in range(steps)]
-    gradient_steps = [{'range': [start, end], 'color': color} for (start, end), color in
-                      zip(step_ranges, gradient_colors)]
+    Returns:
+    - fig (plotly.graph_objs._figure.Figure): The gauge figure.
+    """
+    if steps is None:
+        steps = gradient_resolution(GAUGE_START_COLOR, GAUGE_END_COLOR)
+    gradient_colors = generate_gradient_colors(GAUGE_START_COLOR, GAUGE_END_COLOR, steps)
+
+    # Neighbouring steps that round to the same color are merged into one band.
+    bounds = np.linspace(0, total_cases, steps + 1)
+    gradient_steps = []
+    for i, color in enumerate(gradient_colors):
+        if gradient_steps and gradient_steps[-1]['color'] == color:
+            gradient_steps[-1]['range'][1] = float(bounds[i + 1])
+        else:
+            gradient_steps.append({'range': [float(bounds[i]), float(bounds[i + 1])], 'color': color})
 
     fig = go.Figure(go.Indicator(
         domain={'x': [0, 1], 'y': [0, 1]},
@@ -152,101 +119,96 @@ def speedometer(df, total_cases, steps=1000):
     )
     return fig
 
-def generate_gradient_colors(start_color, end_color, steps):
+
+def _hex_to_rgb(color):
+    return np.array([int(color[i:i+2], 16) for i in range(1, 7, 2)])
+
+
+def gradient_resolution(start_color, end_color):
     """
-    Generates a list of colors forming a gradient between the start and end colors.
+    Returns the number of gradient steps after which a finer split no longer yields new 8-bit colors.
 
     Parameters:
     - start_color (str): The starting color in hex format.
     - end_color (str): The ending color in hex format.
-    - steps (int): The number of steps to divide the gradient into.
 
     Returns:
-    - list of str: List of gradient colors in hex format.
+    - int: The largest per-channel difference between the colors plus one.
     """
-    start_color = np.array([int(start_color[i:i+2], 16) for i in range(1, 7, 2)])
-    end_color = np.array([int(end_color[i:i+2], 16) for i in range(1, 7, 2)])
-    colors = [f"#{''.join(f'{int(c):02x}' for c in start_color + (end_color - start_color) * i / (steps - 1))}" for i in range(steps)]
-    return colors
+    return int(np.abs(_hex_to_rgb(end_color) - _hex_to_rgb(start_color)).max()) + 1
 
 
-def display_progress_bar(actual_value, expected_total, title="Segmented cases", unique_id=""):
+@lru_cache(maxsize=32)
+def generate_gradient_colors(start_color, end_color, steps):
     """
-    Displays a progress bar indicating the progress towards the expected total with a custom pink color and bold text.
+    Generates a list of colors forming a gradient between the start and end colors.
+
     Parameters:
-    - actual_value (float): The current value achieved.
-    - expected_total (float): The total value expected.
-    - title (str): The title displayed above the progress bar.
-    - unique_id (str): A unique identifier to avoid CSS class name collisions.
-    """
-    progress_percentage = actual_value / expected_total
-    bar_width = progress_percentage * 100  # percent for CSS width
-
-    st.markdown(f"**{title}**")
-    print(f"{progress_percentage:.1%}")
-
-    container_class = f"progress-container-{unique_id}"
-    bar_class = f"progress-bar-{unique_id}"
-
-    progress_html = f"""
-    <style>
-    .{container_class} {{
-        width: 100%;
-        background-color: #ddd;
-        border-radius: 5px;
-    }}
-    .{bar_class} {{
-        width: {bar_width:.1f}%;
-        height: 30px;
-        background-color: #ff69b4;
-        text-align: center;
-        line-height: 30px;
-        color: white;
-        font-weight: bold;
-        border-radius: 5px;
-    }}
-    </style>
-    <div class="{container_class}">
-      <div class="{bar_class}">{progress_percentage:.1%}</div>
-    </div>
-    """
+    - start_color (str): The starting color in hex format.
+    - end_color (str): The ending color in hex format.
+    - steps (int): The number of steps to divide the gradient into.
 
-    st.markdown(progress_html, unsafe_allow_html=True)
-    st.markdown(f"**{progress_percentage:.1%}** ({actual_value} of {expected_total})")
+    Returns:
+    - tuple of str: Gradient colors in hex format. The result is memoized per arguments and therefore immutable.
+    """
+    start_color = _hex_to_rgb(start_color)
+    end_color = _hex_to_rgb(end_color)
+    fractions = np.arange(steps)[:, None] / max(steps - 1, 1)
+    channels = (start_color + (end_color - start_color) * fractions).astype(int)
+    packed = (channels[:, 0] << 16) | (channels[:, 1] << 8) | channels[:, 2]
+    return tuple(f"#{c:06x}" for c in packed.tolist())
 
 
-def horizontal_stacked_bar_chart(df):
+@instrumentation.instrumented(measure=figure_cache.figure_payload)
+@cached_figure
+def horizontal_stacked_bar_chart(site_df, top_n=None):
     """
     Creates a single horizontal stacked bar chart for the total cases of each site.
 
+    All sites are drawn by one bar trace whose segments are placed end to end, so the figure size does not grow
+    with a trace per site.
+
     Parameters:
-    - df (DataFrame): The DataFrame containing 'Site' and 'Number of expected cases'.
+    - site_df (DataFrame): The DataFrame containing 'Site' and 'Number of expected cases', e.g. DashboardMetrics.sites.
+    - top_n (int): If given and there are more sites, only the top_n sites with the most expected cases are drawn
+      and the remaining ones are combined into a single 'Other' segment.
     """
-    # Aggregate data by site
-    aggregated_df = df.groupby('Site').sum().reset_index()
+    # Aggregate only the case column by site; a no-op for frames that already hold one row per site
+    aggregated = site_df.groupby('Site', observed=True)['Number of expected cases'].sum()
+    sites = aggregated.index.to_numpy(dtype=object)
+    cases = aggregated.to_numpy()
+
+    # Define a color palette for the sites
+    palette = np.array(plotly.colors.sequential.Plasma)
+    colors = palette[np.arange(len(sites)) % len(palette)]
+
+    if top_n is not None and len(sites) > top_n:
+        keep = np.sort(np.argsort(-cases, kind='stable')[:top_n])
+        other = np.ones(len(sites), dtype=bool)
+        other[keep] = False
+        sites = np.append(sites[keep], f"Other ({other.sum()} sites)")
+        cases = np.append(cases[keep], cases[other].sum())
+        colors = np.append(colors[keep], OTHER_COLOR)
 
     fig = go.Figure()
 
-    # Define a color palette for the sites
-    colors = px.colors.sequential.Plasma
-
-    # Add a bar trace for each site, all with the same y value to stack horizontally
-    for i, row in aggregated_df.iterrows():
-        fig.add_trace(go.Bar(
-            y=['Total Cases'],  # Single category for all sites
-            x=[row['Number of expected cases']],  # Case count for the site
-            orientation='h',
-            name=row['Site'],
-            text=row['Site'],
-            showlegend=False,
-            hovertemplate='<b>%{text}</b><br>' +
-                          'Cases: %{x}<br>' +
-                          '<extra></extra>',  # Customize hover text
-            marker=dict(
-                color=colors[i % len(colors)],  # Assign colors from the palette
-                line=dict(width=1, color='#0E1117')  # Border color
-            )
-        ))
+    # One trace, each site's segment starting where the previous one ends
+    fig.add_trace(go.Bar(
+        y=['Total Cases'] * len(sites),  # Single category for all sites
+        x=cases,  # Case count per site
+        base=np.cumsum(cases) - cases,
+        orientation='h',
+        text=sites,
+        customdata=cases,
+        showlegend=False,
+        hovertemplate='<b>%{text}</b><br>' +
+                      'Cases: %{customdata}<br>' +
+                      '<extra></extra>',  # Customize hover text
+        marker=dict(
+            color=colors,
+            line=dict(width=1, color='#0E1117')  # Border color
+        )
+    ))
 
     # Customize layout to fit a dark theme
     fig.update_layout(
@@ -256,45 +218,33 @@ def horizontal_stacked_bar_chart(df):
         paper_bgcolor='#0E1117',
         plot_bgcolor='#0E1117',
         font=dict(color='white'),
-        barmode='stack',  # Enable stacking
-        showlegend=True,   # Show legend to differentiate sites
+        barmode='overlay',  # Segments are stacked through their base
         height=230
     )
 
     return fig
 
 
-def stacked_bar_holdout_per_tracer(df, tracer_name):
+def _holdout_bar_chart(tracer_name, sites, cases):
     """
-    Generates a stacked bar chart of expected cases per site for a specific tracer's holdout data.
-
-    Parameters:
-    - df (DataFrame): Holdout DataFrame.
-    - tracer_name (str): 'FDG' or 'PSMA'.
-
-    Returns:
-    - fig (plotly.graph_objs._figure.Figure): The stacked bar chart figure.
+    Builds the holdout chart of one tracer from its sites and expected cases, already ordered by rank.
     """
-    tracer_df = df[df["Tracer"] == tracer_name]
-
-    # Group and sum expected cases per site
-    site_df = tracer_df.groupby("Site")["Number of expected cases"].sum().reset_index()
-    site_df = site_df.sort_values(by="Number of expected cases", ascending=False)
-
-    fig = go.Figure()
-
-    colors = px.colors.sequential.Sunsetdark
-
-    for i, row in site_df.iterrows():
-        fig.add_trace(go.Bar(
-            x=[row["Site"]],
-            y=[row["Number of expected cases"]],
-            name=row["Site"],
-            marker=dict(color=colors[i % len(colors)]),
-            text=row["Number of expected cases"],
-            textposition="auto",
-            hovertemplate="<b>%{x}</b><br>Expected: %{y}<extra></extra>"
-        ))
+    # Colors follow the rank, so a site keeps its color as long as its position does. The ranks are passed as
+    # numbers through a colorscale with one stop per palette color, which Plotly validates far faster than one
+    # color string per bar.
+    palette = plotly.colors.sequential.Sunsetdark
+    fig = go.Figure(go.Bar(
+        x=sites,
+        y=cases,
+        marker=dict(color=np.arange(len(sites)) % len(palette),
+                    colorscale=[[i / (len(palette) - 1), color] for i, color in enumerate(palette)],
+                    cmin=0,
+                    cmax=len(palette) - 1),
+        text=cases,
+        textposition="auto",
+        showlegend=False,
+        hovertemplate="<b>%{x}</b><br>Expected: %{y}<extra></extra>"
+    ))
 
     fig.update_layout(
         title=f"Expected Cases per Site – {tracer_name} Holdout",
@@ -308,3 +258,53 @@ def stacked_bar_holdout_per_tracer(df, tracer_name):
     )
 
     return fig
+
+
+@instrumentation.instrumented(measure=figure_cache.figures_payload)
+@cached_figure
+def holdout_bar_charts(holdout_sites):
+    """
+    Builds the holdout chart of every tracer in one pass over the per-(Tracer, Site) counts.
+
+    All rows are ordered once by tracer, expected cases (descending) and site, then split at the tracer
+    boundaries; each chart is a single bar trace over its slice of the arrays.
+
+    Parameters:
+    - holdout_sites (DataFrame): Holdout case counts per (Tracer, Site), as in DashboardMetrics.holdout_sites.
+
+    Returns:
+    - dict: Tracer name -> plotly Figure, for every tracer with holdout sites.
+    """
+    tracers = holdout_sites.index.get_level_values("Tracer").astype(str).to_numpy(dtype=object)
+    sites = holdout_sites.index.get_level_values("Site").astype(str).to_numpy(dtype=object)
+    cases = holdout_sites["Number of expected cases"].to_numpy()
+
+    order = np.lexsort((sites, -cases.astype(np.int64), tracers))
+    tracers, sites, cases = tracers[order], sites[order], cases[order]
+    names, starts = np.unique(tracers, return_index=True)
+    ends = np.append(starts[1:], len(tracers))
+
+    return {name: _holdout_bar_chart(name, sites[start:end], cases[start:end])
+            for name, start, end in zip(names, starts, ends)}
+
+
+@instrumentation.instrumented(measure=figure_cache.figure_payload)
+def stacked_bar_holdout_per_tracer(holdout_sites, tracer_name):
+    """
+    Returns the bar chart of expected cases per site for a specific tracer's holdout data.
+
+    The charts of all tracers are built together by holdout_bar_charts and cached, so asking for each tracer in
+    turn groups and sorts the data only once.
+
+    Parameters:
+    - holdout_sites (DataFrame): Holdout case counts per (Tracer, Site), as in DashboardMetrics.holdout_sites.
+    - tracer_name (str): The tracer, e.g. 'FDG' or 'PSMA'.
+
+    Returns:
+    - fig (plotly.graph_objs._figure.Figure): The bar chart figure; without bars if the tracer has no holdout
+      sites.
+    """
+    fig = holdout_bar_charts(holdout_sites).get(tracer_name)
+    if fig is None:
+        fig = _holdout_bar_chart(tracer_name, np.array([], dtype=object), np.array([], dtype=np.int64))
+    return fig
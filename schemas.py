@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+
+CATEGORY = 'category'
+# Case counts are whole, non-negative numbers far below 2**31.
+COUNT = 'int32'
+
+# Column name -> dtype of the sheets the dashboard ingests. Site, Country and Tracer repeat across thousands of
+# rows and are stored as categoricals; the counts as narrow integers.
+MAIN_SCHEMA = {
+    "Site": CATEGORY,
+    "Country": CATEGORY,
+    "Tracer": CATEGORY,
+    "Number of expected cases": COUNT,
+    "Number of verified cases": COUNT,
+    "Number of curated cases": COUNT,
+}
+HOLDOUT_SCHEMA = {
+    "Site": CATEGORY,
+    "Tracer": CATEGORY,
+    "Number of expected cases": COUNT,
+    "Number of verified cases": COUNT,
+}
+
+# Number of offending values quoted in a SchemaError.
+_EXAMPLES = 3
+
+
+class SchemaError(ValueError):
+    """
+    Raised when a sheet does not match its schema: a column is missing or holds values that are not case counts.
+    """
+
+
+def csv_dtypes(schema):
+    """
+    Returns the dtype argument for pandas.read_csv that parses the categorical columns of a schema directly.
+
+    Count columns are parsed with default inference and checked by enforce, which can then report bad values.
+    """
+    return {column: dtype for column, dtype in schema.items() if dtype == CATEGORY}
+
+
+def _examples(values, bad, column, problem):
+    rows = np.flatnonzero(bad.to_numpy())[:_EXAMPLES]
+    quoted = ", ".join(f"'{values.iloc[row]}' (row {row + 1})" for row in rows)
+    return SchemaError(f"column '{column}' {problem}, e.g. {quoted}")
+
+
+def _to_counts(values, column, dtype):
+    """
+    Converts a column to whole non-negative numbers of the given integer dtype. Empty cells count as 0.
+    """
+    numbers = pd.to_numeric(values, errors='coerce')
+    missing = values.isna()
+    if (numbers.isna() & ~missing).any():
+        raise _examples(values, numbers.isna() & ~missing, column, "has values that are not numbers")
+    numbers = numbers.fillna(0)
+    if (numbers % 1 != 0).any():
+        raise _examples(values, numbers % 1 != 0, column, "has fractional case counts")
+    if (numbers < 0).any():
+        raise _examples(values, numbers < 0, column, "has negative case counts")
+    if (numbers > np.iinfo(dtype).max).any():
+        raise _examples(values, numbers > np.iinfo(dtype).max, column, f"has counts too large for {dtype}")
+    return numbers.astype(dtype)
+
+
+def enforce(df, schema):
+    """
+    Validates a sheet against a schema and converts its columns to the declared dtypes.
+
+    Columns that already have their declared dtype are left alone, so enforcing a conforming frame is cheap.
+    Columns not in the schema are kept as they are.
+
+    Parameters:
+    - df (DataFrame): The parsed sheet.
+    - schema (dict): Column name -> dtype, e.g. MAIN_SCHEMA.
+
+    Returns:
+    - DataFrame: The sheet with the declared dtypes; df itself if nothing had to be converted.
+
+    Raises:
+    - SchemaError: If a column of the schema is missing, or a count column holds values that are not
+      non-negative whole numbers.
+    """
+    missing = [column for column in schema if column not in df.columns]
+    if missing:
+        raise SchemaError(f"missing column(s) {', '.join(map(repr, missing))}; "
+                          f"found {', '.join(map(repr, df.columns))}")
+
+    converted = {}
+    for column, dtype in schema.items():
+        if df[column].dtype == dtype:
+            continue
+        if dtype == CATEGORY:
+            converted[column] = df[column].astype(CATEGORY)
+        else:
+            converted[column] = _to_counts(df[column], column, dtype)
+
+    return df.assign(**converted) if converted else df
@@ -0,0 +1,288 @@
+from datetime import datetime, timezone
+import logging
+import os
+import tempfile
+import threading
+import time
+from botocore.exceptions import BotoCoreError, ClientError
+import constants
+
+
+logger = logging.getLogger(__name__)
+
+# (aws_access_key_id, aws_secret_access_key) -> boto3 S3 client, created on first use.
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+
+# (backend, aws_access_key_id, aws_secret_access_key) -> storage backend, created on first use.
+_storages = {}
+_storages_lock = threading.Lock()
+
+
+def get_s3_client(aws_access_key_id, aws_secret_access_key):
+    """
+    Returns the process-wide S3 client for a set of credentials, creating it on first use.
+
+    boto3 clients are thread-safe, so one client (and its pool of keep-alive HTTPS connections) is shared by
+    every loader and every Streamlit session instead of resolving endpoints and credentials on each call.
+
+    Parameters:
+    - aws_access_key_id (str): AWS Access Key ID with permission to access the bucket.
+    - aws_secret_access_key (str): AWS Secret Access Key corresponding to the Access Key ID.
+
+    Returns:
+    - botocore.client.S3: The shared S3 client.
+    """
+    credentials = (aws_access_key_id, aws_secret_access_key)
+    with _s3_clients_lock:
+        s3 = _s3_clients.get(credentials)
+        if s3 is None:
+            # boto3 takes a noticeable part of a second to import; only processes that talk to S3 pay for it.
+            import boto3
+            from botocore.config import Config
+
+            config = Config(max_pool_connections=constants.S3_MAX_POOL_CONNECTIONS,
+                            connect_timeout=constants.S3_CONNECT_TIMEOUT_SECONDS,
+                            read_timeout=constants.S3_READ_TIMEOUT_SECONDS,
+                            tcp_keepalive=True,
+                            retries={'max_attempts': constants.S3_MAX_ATTEMPTS, 'mode': 'standard'})
+            s3 = boto3.client('s3',
+                              aws_access_key_id=aws_access_key_id,
+                              aws_secret_access_key=aws_secret_access_key,
+                              config=config)
+            _s3_clients[credentials] = s3
+    return s3
+
+
+def use_s3_client(s3, aws_access_key_id=None, aws_secret_access_key=None):
+    """
+    Makes get_s3_client return a given client for a set of credentials, e.g. a local S3 stand-in for benchmarks.
+
+    Parameters:
+    - s3: An object with the get_object and get_paginator methods of a boto3 S3 client.
+    - aws_access_key_id (str): The credentials the client is used for.
+    - aws_secret_access_key (str): The credentials the client is used for.
+    """
+    with _s3_clients_lock:
+        _s3_clients[(aws_access_key_id, aws_secret_access_key)] = s3
+    with _storages_lock:
+        _storages.clear()
+
+
+def _is_not_modified(error):
+    """
+    Returns True if a ClientError is S3's answer to a conditional GET whose ETag still matches.
+    """
+    status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    code = error.response.get('Error', {}).get('Code')
+    return status == 304 or code in ('304', 'NotModified')
+
+
+class S3Storage:
+    """
+    Reads objects from AWS S3 through the shared, pooled S3 client.
+
+    Every backend exposes get_object(bucket_name, file_key, if_none_match=None), which returns a dict with
+    'Body' (a readable file object the caller closes), 'ETag' and 'ContentLength', or None if if_none_match
+    still matches the stored object, and list_objects(bucket_name, prefix), which returns a list of dicts with
+    'Key', 'ETag', 'LastModified' (an aware datetime) and 'Size'.
+    """
+
+    def __init__(self, aws_access_key_id, aws_secret_access_key):
+        self.s3 = get_s3_client(aws_access_key_id, aws_secret_access_key)
+
+    def get_object(self, bucket_name, file_key, if_none_match=None):
+        request = {'Bucket': bucket_name, 'Key': file_key}
+        if if_none_match:
+            request['IfNoneMatch'] = if_none_match
+
+        try:
+            response = self.s3.get_object(**request)
+        except ClientError as error:
+            if if_none_match and _is_not_modified(error):
+                return None
+            raise
+
+        return {'Body': response['Body'], 'ETag': response.get('ETag'),
+                'ContentLength': response.get('ContentLength')}
+
+    def list_objects(self, bucket_name, prefix):
+        paginator = self.s3.get_paginator('list_objects_v2')
+        objects = []
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for item in page.get('Contents', []):
+                objects.append({'Key': item['Key'], 'ETag': item.get('ETag'),
+                                'LastModified': item['LastModified'], 'Size': item['Size']})
+        return objects
+
+
+class LocalStorage:
+    """
+    Reads objects from a local directory laid out as <root>/<bucket_name>/<file_key>, e.g. a snapshot of the
+    bucket or the directory of a DiskCachedStorage. Needs neither credentials nor network.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, bucket_name, file_key):
+        return os.path.join(self.root, bucket_name, *file_key.split('/'))
+
+    def get_object(self, bucket_name, file_key, if_none_match=None):
+        path = self.path(bucket_name, file_key)
+        stat = os.stat(path)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        if if_none_match == etag:
+            return None
+        return {'Body': open(path, 'rb'), 'ETag': etag, 'ContentLength': stat.st_size}
+
+    def list_objects(self, bucket_name, prefix):
+        bucket_root = os.path.join(self.root, bucket_name)
+        objects = []
+        for directory, _, file_names in os.walk(bucket_root):
+            for file_name in file_names:
+                # ETag sidecars written by DiskCachedStorage are not objects of the bucket.
+                if file_name.endswith('.etag'):
+                    continue
+                path = os.path.join(directory, file_name)
+                file_key = os.path.relpath(path, bucket_root).replace(os.sep, '/')
+                if not file_key.startswith(prefix):
+                    continue
+                stat = os.stat(path)
+                objects.append({'Key': file_key, 'ETag': f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+                                'LastModified': datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+                                'Size': stat.st_size})
+        return objects
+
+
+class DiskCachedStorage:
+    """
+    Read-through disk cache in front of another backend, usually S3Storage.
+
+    Objects are mirrored to <cache_dir>/<bucket_name>/<file_key> together with their upstream ETag and served
+    from disk. A mirrored object is revalidated upstream with a conditional GET at most every ttl seconds; if
+    the upstream is unreachable the mirrored copy keeps being served.
+    """
+
+    def __init__(self, upstream, cache_dir, ttl=constants.DISK_CACHE_TTL_SECONDS):
+        self.upstream = upstream
+        self.local = LocalStorage(cache_dir)
+        self.ttl = ttl
+
+    def _refresh(self, bucket_name, file_key):
+        """
+        Brings the mirrored copy of an object up to date if it is missing or older than the TTL.
+
+        Returns:
+        - str: The upstream ETag of the mirrored copy.
+        """
+        path = self.local.path(bucket_name, file_key)
+        etag_path = path + '.etag'
+
+        cached_etag = None
+        if os.path.exists(path) and os.path.exists(etag_path):
+            with open(etag_path) as file:
+                cached_etag = file.read().strip()
+            if time.time() - os.path.getmtime(etag_path) < self.ttl:
+                return cached_etag
+
+        try:
+            response = self.upstream.get_object(bucket_name, file_key, if_none_match=cached_etag)
+        except (BotoCoreError, ClientError):
+            if cached_etag is None:
+                raise
+            logger.warning("Serving cached copy of %s/%s, upstream is unavailable", bucket_name, file_key,
+                           exc_info=True)
+            return cached_etag
+
+        if response is None:
+            os.utime(etag_path)
+            return cached_etag
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        with response['Body'] as body, tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+            while True:
+                chunk = body.read(1024 * 1024)
+                if not chunk:
+                    break
+                file.write(chunk)
+        os.replace(file.name, path)
+        with open(etag_path, 'w') as file:
+            file.write(response['ETag'] or '')
+        return response['ETag']
+
+    def get_object(self, bucket_name, file_key, if_none_match=None):
+        etag = self._refresh(bucket_name, file_key)
+        if if_none_match and if_none_match == etag:
+            return None
+        path = self.local.path(bucket_name, file_key)
+        return {'Body': open(path, 'rb'), 'ETag': etag, 'ContentLength': os.path.getsize(path)}
+
+    def list_objects(self, bucket_name, prefix):
+        try:
+            return self.upstream.list_objects(bucket_name, prefix)
+        except (BotoCoreError, ClientError):
+            logger.warning("Listing cached copies of %s/%s, upstream is unavailable", bucket_name, prefix,
+                           exc_info=True)
+            return self.local.list_objects(bucket_name, prefix)
+
+
+def get_storage(aws_access_key_id, aws_secret_access_key, backend=None):
+    """
+    Returns the process-wide storage backend, creating it on first use.
+
+    Parameters:
+    - aws_access_key_id (str): AWS Access Key ID, used by the S3 backed storages.
+    - aws_secret_access_key (str): AWS Secret Access Key corresponding to the Access Key ID.
+    - backend (str): 's3', 'local' (serve from LION_LOCAL_DIR) or 'cached' (S3 behind a disk cache in
+      LION_DISK_CACHE_DIR). Defaults to the LION_STORAGE_BACKEND environment variable.
+
+    Returns:
+    - S3Storage, LocalStorage or DiskCachedStorage: The storage backend.
+    """
+    backend = backend or constants.STORAGE_BACKEND
+    storage_key = (backend, aws_access_key_id, aws_secret_access_key)
+    with _storages_lock:
+        storage = _storages.get(storage_key)
+        if storage is None:
+            if backend == 's3':
+                storage = S3Storage(aws_access_key_id, aws_secret_access_key)
+            elif backend == 'local':
+                storage = LocalStorage(constants.LOCAL_STORAGE_DIR)
+            elif backend == 'cached':
+                storage = DiskCachedStorage(S3Storage(aws_access_key_id, aws_secret_access_key),
+                                            constants.DISK_CACHE_DIR)
+            else:
+                raise ValueError(f"Unknown storage backend {backend!r}, expected 's3', 'local' or 'cached'")
+            _storages[storage_key] = storage
+    return storage
+
+
+def prewarm(bucket_name, file_keys, aws_access_key_id, aws_secret_access_key, backend='cached'):
+    """
+    Downloads objects through a storage backend once, e.g. to fill the disk cache of a node at deploy time.
+
+    Parameters:
+    - bucket_name (str): The name of the S3 bucket.
+    - file_keys (list of str): The keys to download.
+    - aws_access_key_id (str): AWS Access Key ID with permission to access the bucket.
+    - aws_secret_access_key (str): AWS Secret Access Key corresponding to the Access Key ID.
+    - backend (str): The backend to warm, see get_storage.
+    """
+    storage = get_storage(aws_access_key_id, aws_secret_access_key, backend)
+    for file_key in file_keys:
+        response = storage.get_object(bucket_name, file_key)
+        response['Body'].close()
+
+
+if __name__ == '__main__':
+    import snapshots
+
+    aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
+    aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
+    main_sheet_key = snapshots.find_latest_snapshot(constants.DATA_BUCKET, constants.SNAPSHOT_PREFIX,
+                                                    aws_access_key_id, aws_secret_access_key)
+    prewarm(constants.DATA_BUCKET,
+            [constants.ENHANCE_LOGO_KEY, constants.LION_LOGO_KEY, main_sheet_key, constants.HOLDOUT_SHEET_KEY],
+            aws_access_key_id, aws_secret_access_key)